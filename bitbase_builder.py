@@ -0,0 +1,279 @@
+"""
+Генератор битовых баз эндшпиля ретроградным анализом
+Запуск: python bitbase_builder.py KQK KRK KPK -o bitbases
+
+Поддерживаются только окончания "король и фигуры против одинокого короля"
+(KQK, KRK, KPK, а также 4-фигурные KBNK, KRRK, KQPK, ...). База хранит
+один бит на позицию: 1 - белые (сильнейшая сторона) выигрывают, 0 - нет
+(ничья: выиграть у одинокого короля он не может). Это не WDL-база:
+окончания с фигурами у защищающейся стороны (KRKN, KQKR, KPKP) не строятся,
+в таких позициях движок считает дальше обычным поиском.
+Базы, на которые ведут взятия и превращения, строятся автоматически
+
+Объём: 3 фигуры - 2*64^3 позиций (64 КБ, доли секунды), 4 фигуры - 2*64^4
+позиций (4 МБ, несколько секунд на базу)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import chess
+
+from chess_engine import BITBASE_DIR, BITBASE_ORDER, bitbase_index, bitbase_signature
+
+PROMOTIONS = [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]
+
+
+def parse_signature(signature):
+    """ "KRPK" -> [ROOK, PAWN] (фигуры белых без короля, в порядке BITBASE_ORDER)"""
+    signature = signature.upper()
+    if len(signature) < 3 or signature[0] != "K" or signature[-1] != "K":
+        raise ValueError(f"Ожидается окончание вида KXK, получено {signature!r}")
+    pieces = [chess.PIECE_SYMBOLS.index(c.lower()) for c in signature[1:-1]]
+    if chess.KING in pieces:
+        raise ValueError(f"Неизвестные фигуры в {signature!r}")
+    return sorted(pieces, key=BITBASE_ORDER.index)
+
+
+def attacks(piece_type, sq, occupied):
+    """Поля, которые бьёт белая фигура piece_type с поля sq при занятости occupied"""
+    if piece_type == chess.KING: return chess.BB_KING_ATTACKS[sq]
+    if piece_type == chess.KNIGHT: return chess.BB_KNIGHT_ATTACKS[sq]
+    if piece_type == chess.PAWN: return chess.BB_PAWN_ATTACKS[chess.WHITE][sq]
+    result = 0
+    if piece_type != chess.BISHOP:
+        result |= (chess.BB_RANK_ATTACKS[sq][chess.BB_RANK_MASKS[sq] & occupied] |
+                   chess.BB_FILE_ATTACKS[sq][chess.BB_FILE_MASKS[sq] & occupied])
+    if piece_type != chess.ROOK:
+        result |= chess.BB_DIAG_ATTACKS[sq][chess.BB_DIAG_MASKS[sq] & occupied]
+    return result
+
+
+def insufficient(pieces):
+    """Мат невозможен: голые короли или одна лёгкая фигура"""
+    return not pieces or pieces in ([chess.BISHOP], [chess.KNIGHT])
+
+
+# Все расстановки королей при фиксированных фигурах - одно число на 4096 бит:
+# бит wk * 64 + bk (тот же порядок, что у младших бит bitbase_index).
+# Ходы чёрного короля - сдвиги внутри 64-битных "дорожек", короля белых -
+# сдвиги на целые дорожки, так что Python считает сразу 4096 позиций
+KINGS = 64 * 64
+ONES = sum(1 << 64 * wk for wk in range(64))
+NOT_FILE_A, NOT_FILE_H, NOT_RANK_1, NOT_RANK_8 = (
+    ONES * (chess.BB_ALL & ~bb) for bb in (chess.BB_FILE_A, chess.BB_FILE_H, chess.BB_RANK_1, chess.BB_RANK_8))
+
+
+def spread(mask):
+    """Поля bk (в каждой дорожке), соседние с полями mask"""
+    row = (mask & NOT_FILE_H) << 1 | (mask & NOT_FILE_A) >> 1
+    column = row | mask
+    return row | (column & NOT_RANK_8) << 8 | (column & NOT_RANK_1) >> 8
+
+
+def lanes(wk_mask):
+    """Все позиции, где король белых стоит на поле из wk_mask"""
+    return sum(chess.BB_ALL << 64 * wk for wk in chess.scan_forward(wk_mask))
+
+
+def per_lane(masks):
+    """Маски полей bk для каждого поля wk -> одно число"""
+    return int.from_bytes(b"".join(mask.to_bytes(8, "little") for mask in masks), "little")
+
+
+# Ход короля белых на d: в какую дорожку сдвигать и откуда ход возможен
+KING_STEPS = [(d, lanes(sum(chess.BB_SQUARES[wk] for wk in range(64) if 0 <= wk + d < 64 and
+                            chess.square_distance(wk, wk + d) == 1)))
+              for d in (-9, -8, -7, -1, 1, 7, 8, 9)]
+# Допустимые расстановки королей: не на одном поле и не рядом
+KINGS_APART = per_lane([chess.BB_ALL & ~chess.BB_KING_ATTACKS[wk] & ~chess.BB_SQUARES[wk] for wk in range(64)])
+
+
+class BitbaseGenerator:
+    """
+    Ретроградный анализ по расстановкам фигур (без королей): для каждой
+    хранятся два числа по 4096 бит - выигрыши белых с ходом белых (win) и
+    проигрыши чёрных с ходом чёрных (lost). Проходы повторяются, пока
+    что-то меняется: позиция с ходом белых выиграна, если есть ход в
+    проигрыш чёрных, с ходом чёрных - если ходы есть (или шах), но все
+    ведут в выигрыш белых. Взятия и превращения берутся из готовых баз
+    """
+    def __init__(self, pieces, tables):
+        self.pieces = pieces
+        self.n = len(pieces)
+        self.tables = tables
+        self.configs = 64 ** self.n
+        self.win = [0] * self.configs
+        self.lost = [0] * self.configs
+        self.between = {}
+
+    def lookup(self, pieces, white_to_move, squares):
+        """Все 4096 позиций другой базы (после взятия или превращения)"""
+        if insufficient(pieces): return 0
+        order = sorted(range(len(pieces)), key=lambda i: BITBASE_ORDER.index(pieces[i]))
+        table = self.tables[bitbase_signature(pieces)]
+        offset = bitbase_index(white_to_move, 0, 0, [squares[i] for i in order]) >> 3
+        return int.from_bytes(table[offset:offset + KINGS // 8], "little")
+
+    def squares(self, config):
+        return [config >> 6 * (self.n - 1 - i) & 63 for i in range(self.n)]
+
+    def valid(self, squares):
+        if len(set(squares)) != self.n: return False
+        for pt, sq in zip(self.pieces, squares):
+            if pt == chess.PAWN and not chess.BB_SQUARES[sq] & ~(chess.BB_RANK_1 | chess.BB_RANK_8): return False
+        return True
+
+    def unblocked(self, frm, to):
+        """Позиции, где ни один король не стоит между frm и to"""
+        if (frm, to) not in self.between:
+            between = chess.between(frm, to)
+            self.between[frm, to] = lanes(chess.BB_ALL & ~between) & ONES * (chess.BB_ALL & ~between) if between else None
+        return self.between[frm, to]
+
+    def prepare(self, config):
+        """
+        Всё, что не зависит от результатов: допустимые позиции, поля под боем,
+        взятия чёрного короля, ходы белых фигур и выигрыши превращениями
+
+        Returns:
+            (допустимые с ходом белых - они же поля для отхода чёрного короля,
+             проигрыш чёрных, если отходы не спасают, выигрыши превращением,
+             ходы белых фигур [(расстановка, позиции без помехи или None)])
+        """
+        squares = self.squares(config)
+        occupied = 0
+        for sq in squares: occupied |= chess.BB_SQUARES[sq]
+
+        attacked, defended = [], [0] * self.n
+        for wk in range(64):
+            occ = occupied | chess.BB_SQUARES[wk]
+            mask = chess.BB_KING_ATTACKS[wk]
+            each = [attacks(pt, sq, occ) for pt, sq in zip(self.pieces, squares)]
+            for i, sq in enumerate(squares):
+                others = mask
+                for j, att in enumerate(each):
+                    if j != i: others |= att
+                if others & chess.BB_SQUARES[sq]: defended[i] |= chess.BB_SQUARES[wk]
+            for att in each: mask |= att
+            attacked.append(mask)
+        attacked = per_lane(attacked)
+
+        valid = KINGS_APART & ~lanes(occupied) & ~(ONES * occupied)
+        safe = valid & ~attacked
+        captures = escapes = 0
+        for i, sq in enumerate(squares):
+            rest = self.pieces[:i] + self.pieces[i+1:]
+            won = self.lookup(rest, True, squares[:i] + squares[i+1:])
+            undefended = chess.BB_ALL & ~defended[i] & ~occupied
+            # Спасает взятие, после которого у белых нет выигрыша
+            saved = sum(chess.BB_SQUARES[wk] for wk in chess.scan_forward(undefended) if not won >> 64 * wk + sq & 1)
+            captures |= lanes(undefended) & ONES * chess.BB_KING_ATTACKS[sq]
+            escapes |= lanes(saved) & ONES * chess.BB_KING_ATTACKS[sq]
+        # Проигрыш - мат или все ходы в выигрыш; пат не проигрыш
+        losing = valid & (attacked | spread(safe) | captures) & ~escapes
+
+        promotions = 0
+        moves = []
+        for i, (pt, sq) in enumerate(zip(self.pieces, squares)):
+            shift = 6 * (self.n - 1 - i)
+            if pt == chess.PAWN:
+                if occupied & chess.BB_SQUARES[sq + 8]: continue
+                if chess.square_rank(sq) == 6:
+                    for promotion in PROMOTIONS:
+                        pieces = self.pieces[:i] + [promotion] + self.pieces[i+1:]
+                        promotions |= self.lookup(pieces, False, squares[:i] + [sq + 8] + squares[i+1:])
+                    continue
+                moves.append((config + (8 << shift), None))
+                if chess.square_rank(sq) == 1 and not occupied & chess.BB_SQUARES[sq + 16]:
+                    moves.append((config + (16 << shift), self.unblocked(sq, sq + 16)))
+            else:
+                for s in chess.scan_forward(attacks(pt, sq, occupied) & ~occupied):
+                    moves.append((config + ((s - sq) << shift), self.unblocked(sq, s)))
+        return safe, losing, promotions & safe, moves
+
+    def generate(self):
+        configs = [config for config in range(self.configs) if self.valid(self.squares(config))]
+        prepared = {config: self.prepare(config) for config in configs}
+        win, lost = self.win, self.lost
+        changed = True
+        while changed:
+            changed = False
+            for config in configs:
+                safe, losing, won, moves = prepared[config]
+                # Ход белых: король или фигура в позицию, проигранную чёрными
+                lost_here = lost[config]
+                for d, sources in KING_STEPS:
+                    won |= (lost_here >> 64 * d if d > 0 else lost_here << -64 * d) & sources
+                for target, unblocked in moves:
+                    won |= lost[target] if unblocked is None else lost[target] & unblocked
+                won &= safe
+                # Ход чёрных: проигрыш, если ни один ход не ведёт из выигрыша белых
+                lose = losing & ~spread(safe & ~won)
+                if won != win[config] or lose != lost_here:
+                    win[config], lost[config] = won, lose
+                    changed = True
+        return (b"".join(win[config].to_bytes(KINGS // 8, "little") for config in range(self.configs)) +
+                b"".join(lost[config].to_bytes(KINGS // 8, "little") for config in range(self.configs)))
+
+
+def dependencies(pieces):
+    """Базы, в которые ведут взятия фигур и превращения пешек"""
+    result = set()
+    for i, pt in enumerate(pieces):
+        rest = pieces[:i] + pieces[i+1:]
+        if not insufficient(rest): result.add(bitbase_signature(rest))
+        if pt == chess.PAWN:
+            for promotion in PROMOTIONS:
+                promoted = rest + [promotion]
+                if not insufficient(promoted): result.add(bitbase_signature(promoted))
+    return result
+
+
+def build(signatures, directory=BITBASE_DIR, log=print):
+    """
+    Строит базы (и все нужные им) в directory; уже готовые файлы не пересчитываются
+
+    Returns:
+        {имя базы: содержимое}
+    """
+    os.makedirs(directory, exist_ok=True)
+    tables = {}
+
+    def ensure(signature):
+        if signature in tables: return
+        pieces = parse_signature(signature)
+        signature = bitbase_signature(pieces)
+        for dependency in sorted(dependencies(pieces)):
+            ensure(dependency)
+        path = os.path.join(directory, signature + ".bb")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                tables[signature] = f.read()
+            return
+        start = time.time()
+        bits = BitbaseGenerator(pieces, tables).generate()
+        with open(path, "wb") as f:
+            f.write(bits)
+        tables[signature] = bits
+        wins = sum(bin(byte).count("1") for byte in bits)
+        log(f"{signature}: {wins} выигрышей из {len(bits) * 8} позиций за {time.time() - start:.1f} с -> {path}")
+
+    for signature in signatures:
+        ensure(signature)
+    return tables
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Битовые базы эндшпиля (фигуры против одинокого короля)")
+    parser.add_argument("endings", nargs="*", default=["KQK", "KRK", "KPK"], help="окончания, например KQK KRK KPK")
+    parser.add_argument("-o", "--output", default=BITBASE_DIR, help="каталог баз")
+    args = parser.parse_args(argv)
+    build(args.endings, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
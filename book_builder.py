@@ -0,0 +1,249 @@
+"""
+Построение дебютной книги из PGN
+Запуск: python book_builder.py games.pgn [more.pgn ...] -o book.bin --ply 16 --workers 4
+
+Файлы читаются потоково по партиям (в памяти только текущая партия и
+счётчики позиций), большие файлы делятся на куски, которые разбирают
+параллельно процессы пула. Партия начинается с секции тегов после ходов
+прошлой партии; файл без партий отмечается предупреждением в логе.
+Результат - книга в формате Polyglot (записи >QHHI: ключ позиции, ход, вес,
+learn), её читает get_opening_move
+"""
+
+import argparse
+import io
+import logging
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+ENTRY = struct.Struct(">QHHI")
+# Партия начинается с первой строки секции тегов - тега после ходов прошлой партии
+# (или в начале файла); какой тег первый, не важно
+TAG_START = b"["
+# Блок, которым файл читается назад в поисках строки перед началом куска
+LOOKBACK_BLOCK = 4096
+# Очки за ход (для стороны, сделавшей его): победа 2, ничья 1
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+MAX_WEIGHT = 0xFFFF
+
+logger = logging.getLogger(__name__)
+
+
+def polyglot_move(board, move):
+    """Код хода в Polyglot: to | from << 6 | превращение << 12, рокировка - "король берёт ладью" """
+    to_sq = move.to_square
+    if board.is_castling(move):
+        to_sq = chess.square(7 if chess.square_file(to_sq) > chess.square_file(move.from_square) else 0,
+                             chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_sq | (move.from_square << 6) | (promotion << 12)
+
+
+class BookVisitor(chess.pgn.BaseVisitor):
+    """
+    Собирает (ключ позиции, код хода, цвет) главной линии до max_ply полуходов
+    Варианты пропускаются, объект Game не строится
+    """
+    def __init__(self, max_ply):
+        self.max_ply = max_ply
+        self.game_result = "*"
+        self.moves = []
+
+    def visit_header(self, tagname, tagvalue):
+        if tagname == "Result":
+            self.game_result = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        if len(self.moves) < self.max_ply:
+            self.moves.append((chess.polyglot.zobrist_hash(board), polyglot_move(board, move), board.turn))
+
+    def result(self):
+        return self.game_result, self.moves
+
+
+def chunk_ranges(path, chunks):
+    """Делит файл на примерно равные куски байтов [start, end)"""
+    size = os.path.getsize(path)
+    step = max(1, -(-size // max(1, chunks)))
+    return [(start, min(size, start + step)) for start in range(0, size, step)]
+
+
+def is_tag(line):
+    """Строка тега (метка порядка байтов в начале файла не мешает)"""
+    return line.lstrip().lstrip(b"\xef\xbb\xbf").startswith(TAG_START)
+
+
+def follows_movetext(f, pos):
+    """
+    Последняя непустая строка перед позицией pos (началом строки) - не тег:
+    ходы прошлой партии или начало файла. Тег в pos тогда начинает партию
+    """
+    tail = b""
+    while pos > 0:
+        step = min(pos, LOOKBACK_BLOCK)
+        pos -= step
+        f.seek(pos)
+        tail = f.read(step) + tail
+        text = tail.rstrip()
+        if text and (b"\n" in text or pos == 0):
+            return not is_tag(text[text.rfind(b"\n") + 1:])
+    return True
+
+
+def iter_games(path, start, end):
+    """
+    Текст партий, первая строка которых начинается в [start, end)
+    Партия, начатая в куске, дочитывается до конца даже за его границей
+    """
+    with open(path, "rb") as f:
+        if start:
+            # Дочитываем строку, начатую до start: она принадлежит прошлому куску
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        after_moves = follows_movetext(f, pos)
+        f.seek(pos)
+        lines = None
+        for line in f:
+            tag = is_tag(line)
+            if tag and after_moves:
+                if lines:
+                    yield b"".join(lines).decode("utf-8", "replace")
+                if pos >= end:
+                    return
+                lines = [line]
+            elif lines is not None:
+                lines.append(line)
+            if line.strip():
+                after_moves = not tag
+            pos += len(line)
+        if lines:
+            yield b"".join(lines).decode("utf-8", "replace")
+
+
+def scan_chunk(task):
+    """
+    Разбирает кусок файла (path, start, end, max_ply)
+
+    Returns:
+        (статистика {(ключ, ход): [партий, очков]}, число партий)
+    """
+    path, start, end, max_ply = task
+    stats = {}
+    games = 0
+    for text in iter_games(path, start, end):
+        visitor = chess.pgn.read_game(io.StringIO(text), Visitor=lambda: BookVisitor(max_ply))
+        if visitor is None:
+            continue
+        result, moves = visitor
+        games += 1
+        points = RESULT_POINTS.get(result)
+        if points is None:
+            continue
+        for key, raw, color in moves:
+            entry = stats.get((key, raw))
+            if entry is None:
+                entry = stats[(key, raw)] = [0, 0]
+            entry[0] += 1
+            entry[1] += points[0] if color == chess.WHITE else points[1]
+    return stats, games
+
+
+def merge_stats(total, stats):
+    for k, (games, points) in stats.items():
+        entry = total.get(k)
+        if entry is None:
+            total[k] = [games, points]
+        else:
+            entry[0] += games
+            entry[1] += points
+
+
+def write_book(stats, output, min_games=1):
+    """
+    Записывает отсортированные записи Polyglot; вес хода - набранные им очки
+    (масштабируются в пределах позиции, если не помещаются в 16 бит)
+
+    Returns:
+        Число записей
+    """
+    by_key = {}
+    for (key, raw), (games, points) in stats.items():
+        if games >= min_games and points > 0:
+            by_key.setdefault(key, []).append((raw, points))
+    count = 0
+    with open(output, "wb") as f:
+        for key in sorted(by_key):
+            moves = by_key[key]
+            top = max(points for _, points in moves)
+            scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+            for raw, points in sorted(moves, key=lambda m: -m[1]):
+                f.write(ENTRY.pack(key, raw, max(1, int(points * scale)), 0))
+                count += 1
+    return count
+
+
+def build_book(paths, output, max_ply=16, workers=None, min_games=1, chunks_per_worker=4):
+    """
+    Строит книгу из PGN-файлов
+
+    Args:
+        paths: Список PGN-файлов
+        output: Путь к книге
+        max_ply: Сколько полуходов каждой партии учитывать
+        workers: Процессов (None - по числу ядер, 1 - без пула)
+        min_games: Минимум партий, в которых встретился ход
+        chunks_per_worker: На сколько кусков на процесс делить файлы
+
+    Returns:
+        (партий, записей, секунд)
+    """
+    start = time.time()
+    workers = workers or os.cpu_count() or 1
+    tasks = [(path, lo, hi, max_ply)
+             for path in paths
+             for lo, hi in chunk_ranges(path, workers * chunks_per_worker)]
+    total, per_path = {}, dict.fromkeys(paths, 0)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        results = pool.map(scan_chunk, tasks) if pool else map(scan_chunk, tasks)
+        for task, (stats, n) in zip(tasks, results):
+            merge_stats(total, stats)
+            per_path[task[0]] += n
+    finally:
+        if pool: pool.shutdown()
+    for path, n in per_path.items():
+        if not n:
+            logger.warning("%s: партий не найдено", path)
+    games = sum(per_path.values())
+    entries = write_book(total, output, min_games)
+    return games, entries, time.time() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Дебютная книга Polyglot из PGN-файлов")
+    parser.add_argument("pgn", nargs="+", help="PGN-файлы")
+    parser.add_argument("-o", "--output", default="book.bin", help="файл книги (по умолчанию book.bin)")
+    parser.add_argument("--ply", type=int, default=16, help="глубина книги в полуходах")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов")
+    parser.add_argument("--min-games", type=int, default=1, help="минимум партий на ход")
+    args = parser.parse_args(argv)
+
+    games, entries, seconds = build_book(args.pgn, args.output, args.ply, args.workers, args.min_games)
+    rate = games / seconds if seconds > 0 else 0.0
+    print(f"{games} партий за {seconds:.1f} с ({rate:.0f} партий/с), {entries} записей -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1371 @@
+"""
+Шахматный движок: оценка, поиск, дебютная книга, битовые базы эндшпиля
+Модуль зависит только от python-chess - его импортируют тесты, uci.py и
+утилиты без загрузки pygame; интерфейс (chess_game.py) реэкспортирует его
+"""
+
+import os
+import sys
+import time
+import mmap
+import random
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import chess
+import chess.polyglot
+
+# ==========================================
+# 3. ШАХМАТНЫЙ ДВИЖОК (Полный)
+# ==========================================
+
+OPENING_BOOK = {
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1': ['e2e4', 'd2d4', 'g1f3', 'c2c4'],
+    'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1': ['e7e5', 'c7c5', 'e7e6', 'c7c6'],
+    'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2': ['g1f3', 'f1c4', 'b1c3'],
+    'rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq - 0 1': ['d7d5', 'g8f6', 'e7e6', 'c7c5'],
+}
+
+# Встроенная книга по 64-битному Polyglot-хэшу позиции (считается один раз при загрузке)
+BUILTIN_BOOK = {chess.polyglot.zobrist_hash(chess.Board(fen)): moves for fen, moves in OPENING_BOOK.items()}
+
+# Файл книги по умолчанию рядом с программой (необязателен)
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+
+class OpeningBook:
+    """
+    Дебютная книга в формате Polyglot: отсортированные по ключу записи
+    по 16 байт (>QHHI: хэш позиции, ход, вес, learn). Файл отображается
+    в память и просматривается двоичным поиском, поэтому книга любого
+    размера открывается мгновенно и почти не занимает память
+    Если файла нет или позиции в нём нет - используется OPENING_BOOK
+    """
+    def __init__(self, path=BOOK_PATH):
+        self.path = path
+        self.reader = None
+        self.opened = False
+
+    def _reader(self):
+        if not self.opened:
+            self.opened = True
+            if self.path and os.path.exists(self.path):
+                try: self.reader = chess.polyglot.open_reader(self.path)
+                # stdout занят протоколом UCI - сообщения движка только в stderr
+                except OSError as e: print(f"Книга {self.path} не открыта: {e}", file=sys.stderr)
+        return self.reader
+
+    def choose(self, board, rng=random):
+        """Ход из книги с вероятностью по весу или None"""
+        reader = self._reader()
+        if reader is not None:
+            # По доске, а не по ключу: рокировка в Polyglot записана как "король берёт ладью"
+            try: return reader.weighted_choice(board, random=rng).move
+            except IndexError: pass
+        moves = BUILTIN_BOOK.get(chess.polyglot.zobrist_hash(board))
+        if moves:
+            move = chess.Move.from_uci(rng.choice(moves))
+            if board.is_legal(move): return move
+        return None
+
+    def close(self):
+        if self.reader is not None: self.reader.close()
+        self.reader = None
+        self.opened = False
+
+DEFAULT_BOOK = OpeningBook()
+
+def get_opening_move(board, book=None):
+    return (book or DEFAULT_BOOK).choose(board)
+
+PIECE_VALUES = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 20000}
+
+PAWN_TABLE = [0,0,0,0,0,0,0,0, 50,50,50,50,50,50,50,50, 10,10,20,30,30,20,10,10, 5,5,10,25,25,10,5,5, 0,0,0,20,20,0,0,0, 5,-5,-10,0,0,-10,-5,5, 5,10,10,-20,-20,10,10,5, 0,0,0,0,0,0,0,0]
+KNIGHT_TABLE = [-50,-40,-30,-30,-30,-30,-40,-50, -40,-20,0,5,5,0,-20,-40, -30,5,10,15,15,10,5,-30, -30,0,15,20,20,15,0,-30, -30,5,15,20,20,15,5,-30, -30,0,10,15,15,10,0,-30, -40,-20,0,0,0,0,-20,-40, -50,-40,-30,-30,-30,-30,-40,-50]
+BISHOP_TABLE = [-20,-10,-10,-10,-10,-10,-10,-20, -10,5,0,0,0,0,5,-10, -10,10,10,10,10,10,10,-10, -10,0,10,10,10,10,0,-10, -10,5,5,10,10,5,5,-10, -10,0,5,10,10,5,0,-10, -10,0,0,0,0,0,0,-10, -20,-10,-10,-10,-10,-10,-10,-20]
+ROOK_TABLE = [0,0,0,5,5,0,0,0, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, 5,10,10,10,10,10,10,5, 0,0,0,0,0,0,0,0]
+QUEEN_TABLE = [-20,-10,-10,-5,-5,-10,-10,-20, -10,0,5,0,0,0,0,-10, -10,5,5,5,5,5,0,-10, 0,0,5,5,5,5,0,-5, -5,0,5,5,5,5,0,-5, -10,0,5,5,5,5,0,-10, -10,0,0,0,0,0,0,-10, -20,-10,-10,-5,-5,-10,-10,-20]
+KING_TABLE = [20,30,10,0,0,10,30,20, 20,20,0,0,0,0,20,20, -10,-20,-20,-20,-20,-20,-20,-10, -20,-30,-30,-40,-40,-30,-30,-20, -30,-40,-40,-50,-50,-40,-40,-30, -30,-40,-40,-50,-50,-40,-40,-30, -30,-40,-40,-50,-50,-40,-40,-30, -30,-40,-40,-50,-50,-40,-40,-30]
+
+TABLES = {chess.PAWN: PAWN_TABLE, chess.KNIGHT: KNIGHT_TABLE, chess.BISHOP: BISHOP_TABLE, chess.ROOK: ROOK_TABLE, chess.QUEEN: QUEEN_TABLE, chess.KING: KING_TABLE}
+
+def evaluate_material(board):
+    """Материал + позиционные таблицы полным проходом по 64 полям (эталонная версия)"""
+    score = 0
+    for square in chess.SQUARES:
+        piece = board.piece_at(square)
+        if not piece: 
+            continue
+        
+        val = PIECE_VALUES[piece.piece_type]
+        table = TABLES[piece.piece_type]
+        pos = square if piece.color == chess.WHITE else chess.square_mirror(square)
+        
+        if piece.color == chess.WHITE: 
+            score += val + table[pos]
+        else: 
+            score -= val + table[pos]
+    
+    return score
+
+# Суммы позиционных таблиц по байтам битборда: BYTE_TABLES[color][piece_type][rank][byte]
+# (байт i битборда - это горизонталь i, значение - сумма вкладов всех отмеченных полей)
+BYTE_TABLES = [[None] * 7 for _ in chess.COLORS]
+for _color in chess.COLORS:
+    for _pt, _table in TABLES.items():
+        _sign = 1 if _color == chess.WHITE else -1
+        _ranks = []
+        for _rank in range(8):
+            _sums = [0] * 256
+            for _byte in range(1, 256):
+                _low = _byte & -_byte
+                _sq = _rank * 8 + _low.bit_length() - 1
+                _pos = _sq if _color == chess.WHITE else chess.square_mirror(_sq)
+                _sums[_byte] = _sums[_byte ^ _low] + _sign * (PIECE_VALUES[_pt] + _table[_pos])
+            _ranks.append(_sums)
+        BYTE_TABLES[_color][_pt] = _ranks
+
+def evaluate_material_bitboard(board):
+    """
+    То же, что evaluate_material, но по битбордам фигур:
+    каждый непустой байт битборда даёт готовую сумму из BYTE_TABLES
+    """
+    score = 0
+    piece_masks = ((chess.PAWN, board.pawns), (chess.KNIGHT, board.knights), (chess.BISHOP, board.bishops),
+                   (chess.ROOK, board.rooks), (chess.QUEEN, board.queens), (chess.KING, board.kings))
+    for color in chess.COLORS:
+        occupied = board.occupied_co[color]
+        tables = BYTE_TABLES[color]
+        for piece_type, mask in piece_masks:
+            bb = mask & occupied
+            rank_tables = tables[piece_type]
+            rank = 0
+            while bb:
+                byte = bb & 0xFF
+                if byte: score += rank_tables[rank][byte]
+                bb >>= 8
+                rank += 1
+    return score
+
+def evaluate_board(board, evaluator=None):
+    """
+    Оценивает позицию на доске
+    Положительное значение = хорошо для белых
+    Отрицательное значение = хорошо для чёрных
+    
+    Если передан IncrementalEvaluator, материал берётся из него за O(1)
+    """
+    if board.is_checkmate(): 
+        return -99999 if board.turn else 99999
+    if board.is_stalemate() or board.is_insufficient_material(): 
+        return 0
+    
+    if evaluator is not None:
+        return evaluator.evaluate(board)
+    return evaluate_material_bitboard(board)
+
+def castling_squares(move):
+    """Поля короля и ладьи при рокировке: (king_to, rook_from, rook_to)"""
+    rank = chess.square_rank(move.from_square)
+    if chess.square_file(move.to_square) > chess.square_file(move.from_square):
+        return chess.square(6, rank), chess.square(7, rank), chess.square(5, rank)
+    return chess.square(2, rank), chess.square(0, rank), chess.square(3, rank)
+
+# Вклад фигуры на поле со знаком: SQUARE_VALUES[color][piece_type][square]
+SQUARE_VALUES = [[[0] * 64 for _ in range(7)] for _ in chess.COLORS]
+for _pt, _table in TABLES.items():
+    for _sq in chess.SQUARES:
+        SQUARE_VALUES[chess.WHITE][_pt][_sq] = PIECE_VALUES[_pt] + _table[_sq]
+        SQUARE_VALUES[chess.BLACK][_pt][_sq] = -(PIECE_VALUES[_pt] + _table[chess.square_mirror(_sq)])
+
+class IncrementalEvaluator:
+    """
+    Материал и позиционные таблицы, обновляемые дельтой на каждом ходе
+    push/pop вызываются вместе с board.push/board.pop, оценка листа - O(1)
+    В режиме debug каждая оценка сверяется с evaluate_material
+    """
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.score = 0
+        self.stack = []
+
+    def reset(self, board):
+        self.score = evaluate_material_bitboard(board)
+        self.stack = []
+
+    def push(self, board, move):
+        """Вызывать ДО board.push(move)"""
+        self.stack.append(self.score)
+        if move:
+            self.score += self.move_delta(board, move)
+
+    def pop(self):
+        self.score = self.stack.pop()
+
+    def evaluate(self, board):
+        if self.debug:
+            expected = evaluate_material(board)
+            if expected != self.score:
+                raise AssertionError(f"Incremental eval {self.score} != {expected} in {board.fen()}")
+        return self.score
+
+    @staticmethod
+    def move_delta(board, move):
+        us, them = board.turn, not board.turn
+        from_sq, to_sq = move.from_square, move.to_square
+        piece_type = board.piece_type_at(from_sq)
+        ours = SQUARE_VALUES[us]
+        delta = -ours[piece_type][from_sq]
+        
+        if piece_type == chess.KING and board.is_castling(move):
+            king_to, rook_from, rook_to = castling_squares(move)
+            return delta + ours[chess.KING][king_to] - ours[chess.ROOK][rook_from] + ours[chess.ROOK][rook_to]
+        
+        captured = board.piece_type_at(to_sq)
+        if captured:
+            delta -= SQUARE_VALUES[them][captured][to_sq]
+        elif piece_type == chess.PAWN and to_sq == board.ep_square:
+            delta -= SQUARE_VALUES[them][chess.PAWN][to_sq - 8 if us == chess.WHITE else to_sq + 8]
+        return delta + ours[move.promotion or piece_type][to_sq]
+
+
+# ==========================================
+# 3.1 ХЭШИРОВАНИЕ ПОЗИЦИЙ (Zobrist)
+# ==========================================
+
+# Фиксированное зерно: ключи одинаковы в любом процессе и при любом запуске
+_zobrist_rng = random.Random(0x5A0B)
+ZOBRIST_PIECES = [[[_zobrist_rng.getrandbits(64) for _ in chess.SQUARES] for _ in range(7)] for _ in chess.COLORS]
+ZOBRIST_EP = [_zobrist_rng.getrandbits(64) for _ in range(8)]
+ZOBRIST_TURN = _zobrist_rng.getrandbits(64)
+
+CASTLING_CORNERS = chess.BB_A1 | chess.BB_H1 | chess.BB_A8 | chess.BB_H8
+_CASTLING_CORNER_KEYS = [(chess.BB_SQUARES[sq], _zobrist_rng.getrandbits(64)) for sq in (chess.A1, chess.H1, chess.A8, chess.H8)]
+_CASTLING_KEYS = {}
+for _rights in range(16):
+    _mask, _key = 0, 0
+    for _i, (_bb, _k) in enumerate(_CASTLING_CORNER_KEYS):
+        if _rights & (1 << _i):
+            _mask |= _bb
+            _key ^= _k
+    _CASTLING_KEYS[_mask] = _key
+
+def zobrist_hash(board):
+    """
+    Полный Zobrist-хэш позиции (64 бита)
+    Используется в корне поиска, дальше ключ обновляется через zobrist_after
+    """
+    key = 0
+    for color in chess.COLORS:
+        for piece_type in chess.PIECE_TYPES:
+            keys = ZOBRIST_PIECES[color][piece_type]
+            for sq in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                key ^= keys[sq]
+    key ^= _CASTLING_KEYS[board.clean_castling_rights() & CASTLING_CORNERS]
+    if board.ep_square is not None:
+        key ^= ZOBRIST_EP[chess.square_file(board.ep_square)]
+    if board.turn == chess.BLACK:
+        key ^= ZOBRIST_TURN
+    return key
+
+def zobrist_after(board, move, key):
+    """
+    Ключ позиции после хода move (вызывать ДО board.push)
+    Обновляет только затронутые ходом поля вместо полного пересчёта
+    """
+    key ^= ZOBRIST_TURN
+    if board.ep_square is not None:
+        key ^= ZOBRIST_EP[chess.square_file(board.ep_square)]
+    if not move:
+        return key
+
+    us, them = board.turn, not board.turn
+    from_sq, to_sq = move.from_square, move.to_square
+    piece_type = board.piece_type_at(from_sq)
+    ours = ZOBRIST_PIECES[us]
+    key ^= ours[piece_type][from_sq]
+
+    if piece_type == chess.KING and board.is_castling(move):
+        king_to, rook_from, rook_to = castling_squares(move)
+        key ^= ours[chess.KING][king_to] ^ ours[chess.ROOK][rook_from] ^ ours[chess.ROOK][rook_to]
+    else:
+        captured = board.piece_type_at(to_sq)
+        if captured:
+            key ^= ZOBRIST_PIECES[them][captured][to_sq]
+        elif piece_type == chess.PAWN and to_sq == board.ep_square:
+            key ^= ZOBRIST_PIECES[them][chess.PAWN][to_sq - 8 if us == chess.WHITE else to_sq + 8]
+        key ^= ours[move.promotion or piece_type][to_sq]
+        if piece_type == chess.PAWN and abs(to_sq - from_sq) == 16:
+            key ^= ZOBRIST_EP[chess.square_file(from_sq)]
+
+    if board.castling_rights:
+        rights = board.clean_castling_rights() & CASTLING_CORNERS
+        new_rights = rights & ~chess.BB_SQUARES[from_sq] & ~chess.BB_SQUARES[to_sq]
+        if piece_type == chess.KING:
+            new_rights &= ~(chess.BB_RANK_1 if us == chess.WHITE else chess.BB_RANK_8)
+        if new_rights != rights:
+            key ^= _CASTLING_KEYS[rights] ^ _CASTLING_KEYS[new_rights]
+    return key
+
+# ==========================================
+# 3.2 ТАБЛИЦА ТРАНСПОЗИЦИЙ
+# ==========================================
+
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+class TranspositionTable:
+    """
+    Таблица транспозиций фиксированного размера
+    Каждая корзина хранит две записи: "по глубине" (заменяется только более
+    глубоким поиском или записью из старого поиска) и "всегда заменять"
+    Запись: (key, depth, score, flag, move, age)
+    """
+    ENTRY_BYTES = 160  # примерный размер одной записи в CPython
+
+    def __init__(self, size_mb=32):
+        buckets = max(1, size_mb * 1024 * 1024 // (2 * self.ENTRY_BYTES))
+        self.size = 1 << (buckets.bit_length() - 1)
+        self.mask = self.size - 1
+        self.age = 0
+        self.clear()
+
+    def clear(self):
+        self.deep = [None] * self.size
+        self.recent = [None] * self.size
+
+    def new_search(self):
+        """Помечает записи прошлых поисков как устаревшие (их можно вытеснять)"""
+        self.age += 1
+
+    def probe(self, key):
+        i = key & self.mask
+        entry = self.deep[i]
+        if entry is not None and entry[0] == key: return entry
+        entry = self.recent[i]
+        if entry is not None and entry[0] == key: return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        i = key & self.mask
+        entry = (key, depth, score, flag, move, self.age)
+        old = self.deep[i]
+        if old is None or old[0] == key or depth >= old[1] or old[5] != self.age:
+            self.deep[i] = entry
+        else:
+            self.recent[i] = entry
+
+    def best_move(self, key):
+        entry = self.probe(key)
+        return entry[4] if entry else None
+
+    def principal_variation(self, board, max_len=12):
+        """Восстанавливает главную линию по лучшим ходам из таблицы"""
+        pv = []
+        board = board.copy(stack=False)
+        key = zobrist_hash(board)
+        seen = set()
+        while len(pv) < max_len and key not in seen:
+            seen.add(key)
+            move = self.best_move(key)
+            if move is None or not board.is_legal(move): break
+            pv.append(move)
+            key = zobrist_after(board, move, key)
+            board.push(move)
+        return pv
+
+
+class SearchContext:
+    """
+    Состояние поиска, которое живёт дольше одного вызова:
+    таблица транспозиций, инкрементальная оценка, эвристики упорядочивания
+    (killer, история, ответные ходы), счётчики узлов (nodes - все, qnodes -
+    узлы форсированного поиска), дедлайн и итоги последнего поиска
+    """
+    def __init__(self, tt=None, debug_eval=False, use_quiescence=True, use_heuristics=True, stop=None,
+                 use_pvs=True, use_aspiration=True, use_null_move=True, use_lmr=True, use_see=True,
+                 use_bitbases=True, bitbases=None, use_tt=True, use_delta=True):
+        self.tt = tt if tt is not None else TranspositionTable()
+        # Флаг отмены (threading.Event или multiprocessing.Event)
+        self.stop = stop
+        self.evaluator = IncrementalEvaluator(debug=debug_eval)
+        self.use_quiescence = use_quiescence
+        self.use_heuristics = use_heuristics
+        self.use_pvs = use_pvs
+        self.use_aspiration = use_aspiration
+        self.use_null_move = use_null_move
+        self.use_lmr = use_lmr
+        self.use_see = use_see
+        # Битовые базы эндшпиля (None - общие DEFAULT_BITBASES)
+        self.use_bitbases = use_bitbases
+        self.bitbases = bitbases
+        # Отсечения по оценкам из таблицы транспозиций (ходы из неё упорядочивают перебор всегда).
+        # Без них оценка не зависит от порядка обхода - для сверки разных схем поиска
+        self.use_tt = use_tt
+        # Delta pruning в форсированном поиске (отсечение зависит от alpha)
+        self.use_delta = use_delta
+        self.nodes = 0
+        self.qnodes = 0
+        self.root_ply = 0
+        self.root_pieces = 32
+        self.keys = []
+        # Эвристики упорядочивания тихих ходов (индекс хода: from*64 + to)
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [0] * 4096
+        self.counter_moves = [None] * 4096
+        self.deadline = None
+        # Лимит узлов на поиск (None - без лимита), исчерпание - как истёкшее время
+        self.node_limit = None
+        self.best_score = 0
+        self.completed_depth = 0
+        self.pv = []
+        self.root_moves = []
+
+    def new_search(self, board, age_tt=True):
+        """
+        Подготовка к поиску из позиции board. age_tt=False - записи таблицы не
+        становятся устаревшими (поиск идёт рядом с другим, общим по таблице)
+        """
+        self.nodes = 0
+        self.qnodes = 0
+        self.completed_depth = 0
+        if age_tt: self.tt.new_search()
+        self.set_root(board)
+        # Killer-ходы относятся к конкретной позиции, история между ходами "стареет"
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [h >> 1 for h in self.history]
+
+    def record_cutoff(self, board, move, depth, ply):
+        """Тихий ход вызвал отсечение: запоминаем его как killer, в истории и как ответ на прошлый ход"""
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        idx = move.from_square * 64 + move.to_square
+        self.history[idx] += depth * depth
+        if self.history[idx] > HISTORY_MAX:
+            self.history = [h >> 1 for h in self.history]
+        if board.move_stack:
+            prev = board.peek()
+            self.counter_moves[prev.from_square * 64 + prev.to_square] = move
+
+    def set_root(self, board):
+        """Корень поиска: оценка, номер полухода и ключи предыдущих позиций партии"""
+        self.root_ply = len(board.move_stack)
+        self.root_pieces = chess.popcount(board.occupied)
+        self.evaluator.reset(board)
+        # Повторение возможно только в пределах счётчика 50 ходов
+        keys = []
+        history = board.copy()
+        for _ in range(min(board.halfmove_clock, len(history.move_stack))):
+            history.pop()
+            keys.append(zobrist_hash(history))
+        keys.reverse()
+        self.keys = keys
+
+    def make(self, board, move, key=None):
+        """Делает ход, обновляя оценку; возвращает ключ новой позиции (если передан key)"""
+        child_key = zobrist_after(board, move, key) if key is not None else None
+        self.keys.append(key)
+        self.evaluator.push(board, move)
+        board.push(move)
+        return child_key
+
+    def unmake(self, board):
+        board.pop()
+        self.evaluator.pop()
+        self.keys.pop()
+
+    def is_repetition(self, key, halfmove_clock):
+        """Позиция уже встречалась на пути от начала партии (достаточно одного повтора)"""
+        keys = self.keys
+        n = len(keys)
+        for i in range(n - 4, max(-1, n - halfmove_clock - 1), -2):
+            if keys[i] == key: return True
+        return False
+
+    def fork(self, stop=None):
+        """Контекст для другого потока: общая таблица транспозиций, своя копия эвристик"""
+        ctx = SearchContext(self.tt, self.evaluator.debug, self.use_quiescence, self.use_heuristics, stop,
+                            self.use_pvs, self.use_aspiration, self.use_null_move, self.use_lmr, self.use_see,
+                            self.use_bitbases, self.bitbases, self.use_tt, self.use_delta)
+        ctx.history = self.history[:]
+        ctx.counter_moves = self.counter_moves[:]
+        return ctx
+
+    def check_stop(self):
+        """Вызывается периодически из поиска: отмена, истёкшее время или лимит узлов прерывают его"""
+        if self.stop is not None and self.stop.is_set():
+            raise SearchCancelled()
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+
+
+class SearchAborted(Exception):
+    """Поиск прерван до завершения"""
+
+class SearchTimeout(SearchAborted):
+    """Поиск прерван: истёк бюджет времени"""
+
+class SearchCancelled(SearchAborted):
+    """Поиск отменён извне (новая партия, отмена хода, новый поиск)"""
+
+MAX_SEARCH_DEPTH = 32
+MAX_PLY = 128
+HISTORY_MAX = 1 << 14
+
+INFINITY = 999999
+MATE_SCORE = 99999
+# Оценки за этой границей - мат в (MATE_SCORE - |score|) полуходов
+MATE_BOUND = MATE_SCORE - MAX_PLY
+# Начальная полуширина окна аспирации и ширина, после которой окно становится полным
+ASPIRATION_WINDOW = 50
+ASPIRATION_LIMIT = 1000
+# Нулевой ход: минимальная глубина и сокращение (R+1 начиная с NULL_MOVE_DEEP)
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_R = 2
+NULL_MOVE_DEEP = 6
+# Поздние тихие ходы (начиная с LMR_FULL_MOVES-го) ищутся на меньшую глубину
+LMR_FULL_MOVES = 3
+LMR_MIN_DEPTH = 3
+
+# Общий контекст для вызовов без явного ctx (тесты, консоль)
+DEFAULT_SEARCH = SearchContext()
+
+# ==========================================
+# 3.3 ПОИСК
+# ==========================================
+
+def order_moves(board, moves, hash_move=None, ctx=None, ply=0):
+    killers = counter = history = None
+    if ctx is not None and ctx.use_heuristics:
+        killers = ctx.killers[ply] if ply < MAX_PLY else (None, None)
+        history = ctx.history
+        if board.move_stack:
+            prev = board.peek()
+            counter = ctx.counter_moves[prev.from_square * 64 + prev.to_square]
+    def score(m):
+        if m == hash_move: return 1000000
+        if board.is_capture(m):
+            attacker = board.piece_at(m.from_square)
+            victim = board.piece_at(m.to_square)
+            if attacker and victim:
+                # Проигрывающие размены - после тихих ходов
+                if is_losing_capture(board, m): return see(board, m) - 1000
+                return PIECE_VALUES[victim.piece_type]*10 - PIECE_VALUES[attacker.piece_type]
+        if board.gives_check(m): return 500
+        if m.promotion: return 800
+        if history is None: return 0
+        # Тихие ходы: killer-ходы этого уровня, ответ на прошлый ход, затем история
+        if m == killers[0]: return 400
+        if m == killers[1]: return 390
+        if m == counter: return 300
+        return history[m.from_square * 64 + m.to_square] * 250 // HISTORY_MAX
+    return sorted(moves, key=score, reverse=True)
+
+def capture_score(board, move):
+    """MVV-LVA: ценная жертва и дешёвый нападающий - раньше; превращение добавляет цену новой фигуры"""
+    victim = board.piece_type_at(move.to_square)
+    if victim is None and board.is_en_passant(move): victim = chess.PAWN
+    score = PIECE_VALUES[victim] * 10 - PIECE_VALUES[board.piece_type_at(move.from_square)] if victim else 0
+    if move.promotion: score += PIECE_VALUES[move.promotion]
+    return score
+
+def _see_attackers(board, square, occupied):
+    """Все фигуры, бьющие поле при данной занятости (сквозные атаки открываются сами)"""
+    return (board.attackers_mask(chess.WHITE, square, occupied) |
+            board.attackers_mask(chess.BLACK, square, occupied)) & occupied
+
+def see(board, move):
+    """
+    Статическая оценка размена (SEE) на поле хода
+    Обе стороны по очереди бьют на поле самой дешёвой фигурой и могут
+    остановиться в любой момент. Сквозные атаки (x-ray) открываются по мере
+    снятия фигур, связанные фигуры бьют только вдоль линии связки
+    
+    Returns:
+        Выигрыш материала стороны, делающей ход (0 для рокировки)
+    """
+    if board.is_castling(move): return 0
+    to_sq, from_sq = move.to_square, move.from_square
+    piece = board.piece_type_at(from_sq)
+    occupied = board.occupied ^ chess.BB_SQUARES[from_sq]
+    if board.is_en_passant(move):
+        victim = chess.PAWN
+        occupied ^= chess.BB_SQUARES[to_sq - 8 if board.turn == chess.WHITE else to_sq + 8]
+    else:
+        victim = board.piece_type_at(to_sq)
+    gain = [PIECE_VALUES[victim] if victim else 0]
+    if move.promotion:
+        gain[0] += PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN]
+        piece = move.promotion
+    
+    attackers = _see_attackers(board, to_sq, occupied)
+    side = not board.turn
+    while True:
+        ours = attackers & board.occupied_co[side]
+        # Связанная фигура может бить только не сходя с линии связки
+        for sq in chess.scan_forward(ours & ~board.kings):
+            if not board.pin_mask(side, sq) & chess.BB_SQUARES[to_sq]:
+                ours &= ~chess.BB_SQUARES[sq]
+        if not ours: break
+        for attacker in chess.PIECE_TYPES:
+            candidates = ours & board.pieces_mask(attacker, side)
+            if candidates: break
+        # Король бьёт последним: только если поле больше никто не защищает
+        if attacker == chess.KING and attackers & board.occupied_co[not side]: break
+        gain.append(PIECE_VALUES[piece] - gain[-1])
+        piece = attacker
+        occupied ^= chess.BB_SQUARES[chess.lsb(candidates)]
+        attackers = _see_attackers(board, to_sq, occupied)
+        side = not side
+    
+    # Каждая сторона выбирает: бить дальше или остановиться
+    while len(gain) > 1:
+        last = gain.pop()
+        gain[-1] = -max(-gain[-1], last)
+    return gain[0]
+
+def is_losing_capture(board, move):
+    """Взятие теряет материал (SEE < 0); дешёвый нападающий на дорогую жертву проверку не требует"""
+    victim = board.piece_type_at(move.to_square) or chess.PAWN
+    if PIECE_VALUES[victim] >= PIECE_VALUES[board.piece_type_at(move.from_square)]: return False
+    return see(board, move) < 0
+
+def _promotion_pushes(board):
+    """Превращения без взятия"""
+    pawns = board.pawns & board.occupied_co[board.turn] & (chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2)
+    if not pawns: return []
+    back_rank = chess.BB_RANK_8 if board.turn == chess.WHITE else chess.BB_RANK_1
+    return list(board.generate_legal_moves(pawns, back_rank & ~board.occupied))
+
+def staged_moves(board, hash_move=None, ctx=None, ply=0):
+    """
+    Ленивая генерация ходов по стадиям: ход из таблицы -> выгодные взятия и
+    превращения (MVV-LVA) -> killer-ходы и ответ на прошлый ход -> остальные
+    тихие ходы (по истории) -> проигрывающие взятия (SEE < 0). Каждая стадия
+    генерируется только когда до неё дошла очередь, так что при раннем
+    отсечении остальные ходы не создаются вовсе
+    """
+    yielded = []
+    if hash_move is not None and board.is_legal(hash_move):
+        yielded.append(hash_move)
+        yield hash_move
+    
+    noisy = list(board.generate_legal_captures()) + _promotion_pushes(board)
+    noisy.sort(key=lambda m: capture_score(board, m), reverse=True)
+    bad = []
+    for move in noisy:
+        if move in yielded: continue
+        if is_losing_capture(board, move):
+            bad.append(move)
+        else:
+            yield move
+    
+    use_heuristics = ctx is not None and ctx.use_heuristics
+    if use_heuristics:
+        refutations = list(ctx.killers[ply]) if ply < MAX_PLY else []
+        if board.move_stack:
+            prev = board.peek()
+            refutations.append(ctx.counter_moves[prev.from_square * 64 + prev.to_square])
+        for move in refutations:
+            if (move is not None and move not in yielded and not move.promotion
+                    and not board.is_capture(move) and board.is_legal(move)):
+                yielded.append(move)
+                yield move
+    
+    them = board.occupied_co[not board.turn]
+    quiet = [m for m in board.generate_legal_moves(chess.BB_ALL, ~them)
+             if not m.promotion and not board.is_en_passant(m) and m not in yielded]
+    if use_heuristics:
+        history = ctx.history
+        quiet.sort(key=lambda m: history[m.from_square * 64 + m.to_square], reverse=True)
+    for move in quiet:
+        yield move
+    
+    for move in bad:
+        yield move
+
+def score_to_tt(score, ply):
+    """Оценки мата в таблице хранятся относительно узла, а не корня"""
+    if score > MATE_BOUND: return score + ply
+    if score < -MATE_BOUND: return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score > MATE_BOUND: return score - ply
+    if score < -MATE_BOUND: return score + ply
+    return score
+
+def minimax(board, depth, alpha, beta, maximizing, ctx=None):
+    """
+    Alpha-beta поиск, оценка с точки зрения белых
+    Результаты сохраняются в таблице транспозиций контекста ctx
+    
+    Сторона определяется по board.turn (maximizing оставлен для совместимости:
+    True соответствует ходу белых)
+    """
+    ctx = ctx or DEFAULT_SEARCH
+    ctx.set_root(board)
+    key = zobrist_hash(board)
+    if board.turn == chess.WHITE:
+        return _negamax(board, depth, alpha, beta, ctx, key)
+    return -_negamax(board, depth, -beta, -alpha, ctx, key)
+
+def _negamax(board, depth, alpha, beta, ctx, key):
+    """
+    Negamax с поиском главного варианта (PVS): оценка со стороны того, кто ходит
+    Первый ход ищется с полным окном, остальные - с нулевым окном
+    (только доказать, что они не лучше); при неудаче - повторный поиск
+    """
+    ctx.nodes += 1
+    if not ctx.nodes & 255: ctx.check_stop()
+    # Ничьи без генерации ходов: правило 50 ходов, повторение по стеку ключей,
+    # недостаточный материал (возможен только без пешек, ладей и ферзей)
+    if board.halfmove_clock >= 100 or ctx.is_repetition(key, board.halfmove_clock): return 0
+    if not (board.pawns or board.rooks or board.queens) and board.is_insufficient_material(): return 0
+    ply = len(board.move_stack) - ctx.root_ply
+    # Простое окончание: точный результат из битовой базы. Если в базе уже
+    # корень, узлы не обрываются (иначе поиск не видит дороги к мату) -
+    # база заменяет только оценку в листьях
+    pieces = chess.popcount(board.occupied)
+    if ctx.use_bitbases and pieces <= BITBASE_MAX_PIECES and (depth == 0 or pieces < ctx.root_pieces):
+        score = bitbase_score(board, ctx.bitbases or DEFAULT_BITBASES, ply)
+        if score is not None: return score
+    if depth == 0:
+        # Мат в листе распознаёт форсированный поиск (под шахом он перебирает все ответы)
+        if ctx.use_quiescence: return _quiescence(board, alpha, beta, ctx)
+        if board.is_checkmate(): return -(MATE_SCORE - ply)
+        if board.is_stalemate(): return 0
+        score = ctx.evaluator.evaluate(board)
+        return score if board.turn == chess.WHITE else -score
+
+    alpha_orig = alpha
+    entry = ctx.tt.probe(key)
+    hash_move = None
+    if entry is not None:
+        hash_move = entry[4]
+        if ctx.use_tt and entry[1] >= depth:
+            flag, tt_score = entry[3], score_from_tt(entry[2], ply)
+            if flag == TT_EXACT: return tt_score
+            if flag == TT_LOWER: alpha = max(alpha, tt_score)
+            else: beta = min(beta, tt_score)
+            if alpha >= beta: return tt_score
+
+    in_check = board.is_check()
+    if (ctx.use_null_move and depth >= NULL_MOVE_MIN_DEPTH and not in_check
+            and beta - alpha == 1 and abs(beta) < MATE_BOUND):
+        score = _null_move_search(board, depth, beta, ctx, key)
+        if score is not None: return score
+
+    best_score, best_move = -INFINITY, None
+    searched = 0
+    for move in staged_moves(board, hash_move, ctx, ply):
+        quiet = not board.is_capture(move) and not move.promotion
+        child_key = ctx.make(board, move, key)
+        reduction = 0
+        if (ctx.use_lmr and quiet and searched >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH
+                and not in_check and not board.is_check()):
+            reduction = 2 if depth >= 6 and searched >= 2 * LMR_FULL_MOVES else 1
+        if best_move is None or not (ctx.use_pvs or reduction):
+            score = -_negamax(board, depth-1, -beta, -alpha, ctx, child_key)
+        else:
+            score = -_negamax(board, depth-1-reduction, -alpha-1, -alpha, ctx, child_key)
+            # Сокращённый ход неожиданно улучшил alpha - проверяем на полной глубине
+            if reduction and score > alpha:
+                score = -_negamax(board, depth-1, -alpha-1, -alpha, ctx, child_key)
+            if alpha < score < beta:
+                score = -_negamax(board, depth-1, -beta, -alpha, ctx, child_key)
+        ctx.unmake(board)
+        searched += 1
+        if score > best_score:
+            best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    if not board.is_capture(move) and not move.promotion:
+                        ctx.record_cutoff(board, move, depth, ply)
+                    break
+
+    if best_move is None:
+        # Ходов нет: мат или пат (легальные ходы сгенерированы один раз - в цикле выше)
+        return -(MATE_SCORE - ply) if board.is_check() else 0
+
+    if best_score <= alpha_orig: flag = TT_UPPER
+    elif best_score >= beta: flag = TT_LOWER
+    else: flag = TT_EXACT
+    ctx.tt.store(key, depth, score_to_tt(best_score, ply), flag, best_move)
+    return best_score
+
+def _null_move_search(board, depth, beta, ctx, key):
+    """
+    Нулевой ход: отдаём ход сопернику и ищем на уменьшенную глубину
+    Если позиция всё равно не хуже beta - узел отсекается (возвращает оценку, иначе None)
+    
+    Не применяется два раза подряд, без фигур кроме пешек (цугцванг
+    в пешечных окончаниях) и когда статическая оценка уже ниже beta
+    """
+    if board.move_stack and not board.move_stack[-1]: return None
+    if not board.occupied_co[board.turn] & ~(board.pawns | board.kings): return None
+    static = ctx.evaluator.evaluate(board)
+    if board.turn == chess.BLACK: static = -static
+    if static < beta: return None
+    
+    reduction = NULL_MOVE_R + 1 if depth >= NULL_MOVE_DEEP else NULL_MOVE_R
+    null_key = ctx.make(board, chess.Move.null(), key)
+    score = -_negamax(board, max(0, depth-1-reduction), -beta, -beta+1, ctx, null_key)
+    ctx.unmake(board)
+    if score < beta: return None
+    # Мат после пропуска хода не доказан для реальной позиции
+    return beta if score >= MATE_BOUND else score
+
+def _search_root(board, depth, ctx, key, moves, alpha=None, beta=None):
+    """
+    Один проход корня на заданную глубину в окне (alpha, beta)
+    Возвращает (лучший ход, оценка со стороны того, кто ходит)
+    """
+    alpha = -INFINITY if alpha is None else alpha
+    beta = INFINITY if beta is None else beta
+    alpha_orig = alpha
+    best_move, best_score = None, -INFINITY
+    
+    for move in moves:
+        child_key = ctx.make(board, move, key)
+        if best_move is None or not ctx.use_pvs:
+            score = -_negamax(board, depth-1, -beta, -alpha, ctx, child_key)
+        else:
+            score = -_negamax(board, depth-1, -alpha-1, -alpha, ctx, child_key)
+            if alpha < score < beta:
+                score = -_negamax(board, depth-1, -beta, -alpha, ctx, child_key)
+        ctx.unmake(board)
+        
+        if score > best_score:
+            best_score, best_move = score, move
+            alpha = max(alpha, score)
+        
+        # Alpha-beta отсечение
+        if alpha >= beta:
+            break
+    
+    if best_score <= alpha_orig: flag = TT_UPPER
+    elif best_score >= beta: flag = TT_LOWER
+    else: flag = TT_EXACT
+    ctx.tt.store(key, depth, best_score, flag, best_move)
+    return best_move, best_score
+
+def _search_aspiration(board, depth, ctx, key, moves, previous):
+    """
+    Корень в узком окне вокруг оценки прошлой итерации; при выходе за окно
+    оно расширяется ступенчато (x4) с той стороны, где случилась неудача
+    """
+    delta = ASPIRATION_WINDOW
+    alpha, beta = previous - delta, previous + delta
+    while True:
+        move, score = _search_root(board, depth, ctx, key, moves, alpha, beta)
+        if score <= alpha:
+            delta *= 4
+            alpha = -INFINITY if delta > ASPIRATION_LIMIT else max(-INFINITY, score - delta)
+        elif score >= beta:
+            delta *= 4
+            beta = INFINITY if delta > ASPIRATION_LIMIT else min(INFINITY, score + delta)
+            # Ход, пробивший окно сверху, - первый кандидат при повторе
+            moves.remove(move)
+            moves.insert(0, move)
+        else:
+            return move, score
+
+def allocate_time(remaining, increment=0, moves_played=0):
+    """
+    Бюджет времени на один ход по показаниям часов
+    
+    Args:
+        remaining: Секунд осталось на часах
+        increment: Добавка за ход в секундах
+        moves_played: Сколько полных ходов уже сыграно (board.fullmove_number - 1)
+        
+    Returns:
+        Секунды на обдумывание хода: остаток делится на ходы до 40-го, но не меньше чем на 15
+    """
+    moves_to_go = max(15, 40 - moves_played)
+    budget = remaining / moves_to_go + increment * 0.8
+    # Никогда не тратим больше половины остатка
+    return max(0.05, min(budget, remaining * 0.5 - 0.1))
+
+def iterative_deepening(board, max_depth, time_limit=None, ctx=None, on_iteration=None):
+    """
+    Итеративное углубление: глубина 1, 2, 3, ... пока не кончится время
+    
+    Args:
+        board: Шахматная доска
+        max_depth: Максимальная глубина
+        time_limit: Бюджет в секундах (None - без ограничения)
+        ctx: SearchContext с таблицей транспозиций (по умолчанию общий)
+        on_iteration: Вызывается после каждой итерации: on_iteration(depth, move, score, ctx)
+        
+    Returns:
+        Лучший ход последней завершённой итерации или None если нет ходов
+        (глубина и оценка со стороны ходящего сохраняются в ctx.completed_depth / ctx.best_score)
+        
+    Raises:
+        SearchCancelled: если поиск отменён через ctx.stop
+    """
+    ctx = ctx or DEFAULT_SEARCH
+    # Итоги прошлого поиска не должны пережить этот, даже если он ничего не ищет
+    ctx.pv = []
+    ctx.root_moves = []
+    legal_moves = list(board.legal_moves)
+    if not legal_moves:
+        return None
+    
+    # Если всего один ход - возвращаем его
+    if len(legal_moves) == 1:
+        return legal_moves[0]
+    
+    ctx.new_search(board)
+    start = time.time()
+    ctx.deadline = start + time_limit if time_limit else None
+    key = zobrist_hash(board)
+    stack_len = len(board.move_stack)
+    
+    best_move = None
+    moves = order_moves(board, legal_moves, ctx.tt.best_move(key))
+    try:
+        for depth in range(1, max_depth+1):
+            try:
+                if ctx.use_aspiration and depth >= 3 and abs(ctx.best_score) < MATE_BOUND:
+                    move, score = _search_aspiration(board, depth, ctx, key, moves, ctx.best_score)
+                else:
+                    move, score = _search_root(board, depth, ctx, key, moves)
+            except SearchAborted as aborted:
+                # Итерация не завершена - откатываем доску и берём прошлый результат
+                while len(board.move_stack) > stack_len: board.pop()
+                if isinstance(aborted, SearchCancelled): raise
+                break
+            best_move, ctx.best_score, ctx.completed_depth = move, score, depth
+            if on_iteration is not None: on_iteration(depth, move, score, ctx)
+            # Главная линия прошлой итерации ищется первой (остальная часть PV - через хэш-ходы)
+            moves.remove(move)
+            moves.insert(0, move)
+            # Следующая итерация заметно дольше текущей - не начинаем, если не успеем
+            if time_limit and time.time() - start > time_limit * 0.5:
+                break
+    finally:
+        ctx.deadline = None
+    ctx.pv = ctx.tt.principal_variation(board)
+    ctx.root_moves = moves
+    return best_move or moves[0]
+
+def multipv_search(board, depth, lines=3, ctx=None):
+    """
+    Несколько лучших линий (MultiPV) с итеративным углублением
+    Все ходы корня ищутся в одном проходе с общими границами: первые lines
+    ходов - с полным окном, остальным достаточно доказать в нулевом окне, что
+    они не лучше последней из найденных линий (иначе - повторный поиск)
+    
+    Args:
+        board: Шахматная доска (не изменяется)
+        depth: Глубина поиска
+        lines: Количество линий
+        ctx: SearchContext; таблица транспозиций общая с основным поиском ИИ
+            (подсказка её не старит: записи ИИ, который может думать в это
+            время, не должны вытесняться как устаревшие)
+        
+    Returns:
+        Список (ход, оценка со стороны ходящего, главная линия) по убыванию оценки;
+        при отмене по таймауту - результат последней завершённой итерации
+        
+    Raises:
+        SearchCancelled: если поиск отменён через ctx.stop
+    """
+    legal_moves = list(board.legal_moves)
+    if not legal_moves:
+        return []
+    
+    ctx = ctx or DEFAULT_SEARCH
+    ctx.new_search(board, age_tt=False)
+    key = zobrist_hash(board)
+    stack_len = len(board.move_stack)
+    lines = min(lines, len(legal_moves))
+    
+    moves = order_moves(board, legal_moves, ctx.tt.best_move(key))
+    best = []
+    try:
+        for d in range(1, depth+1):
+            scored = []
+            for move in moves:
+                child_key = ctx.make(board, move, key)
+                if len(scored) < lines:
+                    score = -_negamax(board, d-1, -INFINITY, INFINITY, ctx, child_key)
+                else:
+                    bound = scored[lines-1][1]
+                    score = -_negamax(board, d-1, -bound-1, -bound, ctx, child_key)
+                    if score > bound:
+                        score = -_negamax(board, d-1, -INFINITY, -bound, ctx, child_key)
+                ctx.unmake(board)
+                scored.append((move, score))
+                scored.sort(key=lambda x: x[1], reverse=True)
+            moves = [m for m, _ in scored]
+            best, ctx.best_score, ctx.completed_depth = scored[:lines], scored[0][1], d
+            ctx.tt.store(key, d, scored[0][1], TT_EXACT, scored[0][0])
+    except SearchAborted as aborted:
+        while len(board.move_stack) > stack_len: board.pop()
+        if isinstance(aborted, SearchCancelled): raise
+    
+    result = []
+    for move, score in best:
+        board.push(move)
+        result.append((move, score, [move] + ctx.tt.principal_variation(board)))
+        board.pop()
+    ctx.root_moves = moves
+    return result
+
+# Запас для delta pruning: взятие, которое даже с этим запасом не дотягивает до alpha, не смотрим
+DELTA_MARGIN = 200
+
+def _noisy_moves(board):
+    """Взятия и превращения, упорядоченные по MVV-LVA"""
+    moves = list(board.generate_legal_captures()) + _promotion_pushes(board)
+    moves.sort(key=lambda m: capture_score(board, m), reverse=True)
+    return moves
+
+def _quiescence(board, alpha, beta, ctx):
+    """
+    Форсированный поиск в листьях: только взятия и превращения, пока позиция
+    не станет спокойной. Stand-pat - право не брать; под шахом перебираются все ответы
+    """
+    ctx.nodes += 1
+    ctx.qnodes += 1
+    if not ctx.nodes & 255: ctx.check_stop()
+    
+    if board.is_check():
+        moves = sorted(board.generate_legal_moves(), key=lambda m: capture_score(board, m), reverse=True)
+        if not moves: return -(MATE_SCORE - (len(board.move_stack) - ctx.root_ply))
+        best = -INFINITY
+        stand_pat = None
+    else:
+        stand_pat = ctx.evaluator.evaluate(board)
+        if board.turn == chess.BLACK: stand_pat = -stand_pat
+        if stand_pat >= beta: return stand_pat
+        alpha = max(alpha, stand_pat)
+        best = stand_pat
+        moves = _noisy_moves(board)
+    
+    for move in moves:
+        if stand_pat is not None and not move.promotion:
+            # Delta pruning: даже выигрыш жертвы с запасом не улучшит результат
+            victim = board.piece_type_at(move.to_square) or chess.PAWN
+            if ctx.use_delta and stand_pat + PIECE_VALUES[victim] + DELTA_MARGIN <= alpha:
+                continue
+            # Взятие, проигрывающее материал в размене, не смотрим
+            if ctx.use_see and is_losing_capture(board, move):
+                continue
+        ctx.make(board, move)
+        score = -_quiescence(board, -beta, -alpha, ctx)
+        ctx.unmake(board)
+        if score > best:
+            best = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta: break
+    return best
+
+# Фиксированный набор позиций для сравнения настроек поиска
+BENCHMARK_FENS = [
+    chess.STARTING_FEN,
+    "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    "2r3k1/pp3ppp/2n1b3/3p4/3P4/2N1B3/PP3PPP/2R3K1 w - - 0 20",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+def benchmark(depth=4, fens=None, **options):
+    """
+    Прогон find_best_move по набору позиций со свежим контекстом для каждой
+    
+    Args:
+        depth: Глубина поиска
+        fens: Позиции (по умолчанию BENCHMARK_FENS)
+        **options: Параметры SearchContext (use_quiescence, use_heuristics, ...)
+        
+    Returns:
+        (узлов всего, секунд, список лучших ходов)
+    """
+    nodes, moves = 0, []
+    start = time.perf_counter()
+    for fen in fens or BENCHMARK_FENS:
+        ctx = SearchContext(TranspositionTable(size_mb=8), **options)
+        moves.append(find_best_move(chess.Board(fen), depth, ctx))
+        nodes += ctx.nodes
+    return nodes, time.perf_counter() - start, moves
+
+def find_best_move(board, depth, ctx=None):
+    """
+    Находит лучший ход для текущей позиции
+    
+    Args:
+        board: Шахматная доска
+        depth: Глубина поиска
+        ctx: SearchContext с таблицей транспозиций (по умолчанию общий)
+        
+    Returns:
+        chess.Move или None если нет легальных ходов
+    """
+    return iterative_deepening(board, depth, None, ctx)
+
+# ==========================================
+# 3.4 ПАРАЛЛЕЛЬНЫЙ ПОИСК (процессы)
+# ==========================================
+
+# Состояние процесса-исполнителя: номер текущего поиска, оценки ходов корня, свой контекст
+_search_generation = None
+_root_scores = None
+_worker_ctx = None
+
+# Больше, чем легальных ходов в любой позиции
+MAX_ROOT_MOVES = 256
+# Настройки, при которых оценка не зависит от окна и порядка обхода: отсечения по
+# таблице транспозиций, нулевой ход, LMR и delta pruning выключены. С ними
+# ParallelSearch выбирает тот же ход, что find_best_move с SearchContext(**PARALLEL_OPTIONS)
+PARALLEL_OPTIONS = dict(use_tt=False, use_null_move=False, use_lmr=False, use_delta=False)
+
+class _GenerationStop:
+    """Флаг отмены задачи исполнителя: задача устарела, если номер текущего поиска сменился"""
+    def __init__(self, current, generation):
+        self.current = current
+        self.generation = generation
+
+    def is_set(self):
+        return self.current.value != self.generation
+
+def _init_search_worker(search_generation, root_scores, options):
+    global _search_generation, _root_scores, _worker_ctx
+    _search_generation = search_generation
+    _root_scores = root_scores
+    _worker_ctx = SearchContext(**options)
+
+def _search_root_move(board, index, move, depth, generation):
+    """
+    Оценка хода корня номер index (в порядке последовательного поиска) в
+    процессе-исполнителе, со стороны того, кто ходит
+
+    Окно снизу повторяет корень find_best_move: ход должен быть строго лучше
+    всех ходов перед ним и не хуже ходов после него - из равных выигрывает
+    первый в порядке. Оценки, не превысившие нижнюю границу, - только оценки сверху
+
+    Returns:
+        (оценка, узлов, главная линия) или None, если поиск уже отменён
+    """
+    stop = _GenerationStop(_search_generation, generation)
+    if stop.is_set(): return None
+    ctx = _worker_ctx
+    ctx.stop = stop
+    # Своя история у каждой задачи: результат не зависит от того, какие ходы процесс считал до неё
+    ctx.new_search(board)
+    ctx.history = [0] * 4096
+    ctx.counter_moves = [None] * 4096
+    with _root_scores.get_lock():
+        before = max(_root_scores[:index], default=-INFINITY)
+        after = max(_root_scores[index+1:], default=-INFINITY)
+    floor = max(before, after - 1)
+    key = zobrist_hash(board)
+    child_key = ctx.make(board, move, key)
+    try:
+        score = -_negamax(board, depth-1, -INFINITY, -floor, ctx, child_key)
+        pv = [move] + ctx.tt.principal_variation(board)
+    except SearchCancelled:
+        return None
+    finally:
+        ctx.unmake(board)
+    if score > floor:
+        with _root_scores.get_lock():
+            if not stop.is_set(): _root_scores[index] = score
+    return score, ctx.nodes, pv
+
+
+class ParallelSearch:
+    """
+    Поиск с разделением ходов корня между процессами (обходит GIL)
+    Порядок ходов берётся из последовательного поиска на глубину depth-1,
+    из равных по оценке выбирается первый в этом порядке - как в find_best_move.
+    С настройками PARALLEL_OPTIONS ход совпадает с последовательным поиском на той
+    же глубине. С остальными оценки могут отличаться на несколько сантипешек: у
+    процессов свои таблицы транспозиций, а отсечения зависят от порядка обхода
+
+    Вызовы find_best_move выполняются по одному: новый поиск ждёт, пока
+    прерванный предыдущий не вернёт управление
+    """
+    def __init__(self, workers=None, **options):
+        self.workers = workers or os.cpu_count() or 1
+        self.options = options
+        # Номер текущего поиска: задачи с другим номером прерываются
+        self.generation = multiprocessing.Value('i', 0)
+        self.root_scores = multiprocessing.Array('i', MAX_ROOT_MOVES)
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_search_worker,
+                                            initargs=(self.generation, self.root_scores, options))
+        self.lock = threading.Lock()
+        # Таблица транспозиций предварительного поиска общая для всех вызовов
+        self.ctx = SearchContext(**options)
+        self.nodes = 0
+        self.pv = []
+
+    def find_best_move(self, board, depth, stop=None):
+        """
+        Аналог find_best_move(board, depth), ходы корня считаются параллельно
+        
+        Args:
+            stop: threading.Event - при его установке поиск во всех процессах прерывается
+        
+        Returns:
+            chess.Move или None если нет легальных ходов
+            (главная линия выбранного хода - в self.pv)
+            
+        Raises:
+            SearchCancelled: если поиск отменён через stop
+        """
+        with self.lock:
+            ctx = self.ctx.fork(stop)
+            legal_moves = list(board.legal_moves)
+            if len(legal_moves) <= 1 or depth <= 1:
+                move = find_best_move(board, depth, ctx)
+                self.nodes, self.pv = ctx.nodes, ctx.pv
+                return move
+            
+            iterative_deepening(board, depth-1, None, ctx)
+            moves = ctx.root_moves
+            generation = self.cancel()
+            with self.root_scores.get_lock():
+                # Весь массив: хвост от прошлого поиска с большим числом ходов поднял бы границу
+                for i in range(MAX_ROOT_MOVES): self.root_scores[i] = -INFINITY
+            root = board.copy()
+            futures = [self.executor.submit(_search_root_move, root, i, move, depth, generation)
+                       for i, move in enumerate(moves)]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=0.05)
+                if stop is not None and stop.is_set():
+                    # Задачи видят смену номера и выходят; ждём их, чтобы следующий поиск начался с чистого листа
+                    self.cancel()
+                    for f in pending: f.cancel()
+                    wait(pending)
+                    raise SearchCancelled()
+            results = [f.result() for f in futures]
+            self.nodes = ctx.nodes + sum(r[1] for r in results)
+            
+            best = None
+            for move, (score, _, pv) in zip(moves, results):
+                if best is None or score > best[0]:
+                    best = (score, move, pv)
+            self.pv = best[2]
+            return best[1]
+
+    def cancel(self):
+        """Прерывает задачи текущего поиска; возвращает новый номер поиска"""
+        with self.generation.get_lock():
+            self.generation.value += 1
+            return self.generation.value
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# ==========================================
+# 3.5 БИТОВЫЕ БАЗЫ ЭНДШПИЛЯ
+# ==========================================
+
+# Базы лежат рядом с программой, строятся bitbase_builder.py
+BITBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bitbases")
+# Порядок фигур в имени базы и в индексе: KQRK, KRPK, ...
+BITBASE_ORDER = [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT, chess.PAWN]
+# Сколько фигур (с королями) может быть в позиции из базы
+BITBASE_MAX_PIECES = 4
+# Выигрыш по базе: выше любой оценки, но ниже мата
+KNOWN_WIN = 20000
+
+def bitbase_signature(piece_types):
+    """Имя базы по фигурам сильнейшей стороны: [ROOK, QUEEN] -> "KQRK" """
+    pieces = sorted(piece_types, key=BITBASE_ORDER.index)
+    return "K" + "".join(chess.piece_symbol(pt).upper() for pt in pieces) + "K"
+
+def bitbase_index(white_to_move, wk, bk, squares):
+    """
+    Номер позиции в базе: очередь хода, поля фигур в порядке BITBASE_ORDER,
+    король белых, король чёрных (по 6 бит на поле). Все расстановки королей
+    при одних фигурах - подряд 512 байт, генератор считает их одним числом
+    """
+    index = 0 if white_to_move else 1
+    for sq in squares:
+        index = index << 6 | sq
+    return (index << 6 | wk) << 6 | bk
+
+class Bitbases:
+    """
+    Битовые базы "фигуры против одинокого короля": один бит на позицию,
+    1 - у сильнейшей стороны (всегда белые после нормализации) выигрыш.
+    Позиций с фигурами у обеих сторон (KRKN, KQKR, ...) в базах нет
+    Файлы отображаются в память, проба - чтение одного байта
+    Позиция с одиноким королём у белых зеркалится (board.mirror())
+    """
+    def __init__(self, directory=BITBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, signature):
+        if signature not in self.tables:
+            table = None
+            path = os.path.join(self.directory, signature + ".bb")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.tables[signature] = table
+        return self.tables[signature]
+
+    def probe(self, board):
+        """
+        Результат позиции для стороны, которая ходит: 1 выигрыш, 0 ничья, -1 проигрыш
+        None - позиции нет в базах (не тот материал, права на рокировку, нет файла)
+        """
+        if board.castling_rights: return None
+        if chess.popcount(board.occupied_co[chess.WHITE]) == 1:
+            board = board.mirror()
+        if chess.popcount(board.occupied_co[chess.BLACK]) != 1: return None
+        pieces = sorted(((board.piece_type_at(sq), sq) for sq in chess.scan_forward(board.occupied_co[chess.WHITE])
+                         if sq != board.king(chess.WHITE)), key=lambda p: BITBASE_ORDER.index(p[0]))
+        if not pieces: return 0
+        table = self.table(bitbase_signature([pt for pt, _ in pieces]))
+        if table is None: return None
+        index = bitbase_index(board.turn, board.king(chess.WHITE), board.king(chess.BLACK), [sq for _, sq in pieces])
+        if not table[index >> 3] >> (index & 7) & 1: return 0
+        return 1 if board.turn == chess.WHITE else -1
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None: table.close()
+        self.tables = {}
+
+DEFAULT_BITBASES = Bitbases()
+
+def mop_up(board, strong):
+    """
+    Оценка выигранного окончания для сильнейшей стороны: материал, слабый
+    король - к краю, свой король - ближе к нему, пешки - вперёд
+    """
+    weak_king, strong_king = board.king(not strong), board.king(strong)
+    score = sum(PIECE_VALUES[pt] * chess.popcount(board.pieces_mask(pt, strong)) for pt in BITBASE_ORDER)
+    f, r = chess.square_file(weak_king), chess.square_rank(weak_king)
+    score += 10 * (max(3 - f, f - 4) + max(3 - r, r - 4))
+    score += 4 * (7 - chess.square_distance(strong_king, weak_king))
+    for sq in chess.scan_forward(board.pieces_mask(chess.PAWN, strong)):
+        rank = chess.square_rank(sq)
+        score += 20 * (rank if strong == chess.WHITE else 7 - rank)
+    return score
+
+def bitbase_score(board, bitbases, ply):
+    """Оценка позиции из базы со стороны того, кто ходит, или None"""
+    wdl = bitbases.probe(board)
+    if not wdl: return wdl
+    if wdl < 0 and board.is_check() and board.is_checkmate():
+        return -(MATE_SCORE - ply)
+    score = KNOWN_WIN + mop_up(board, board.turn if wdl > 0 else not board.turn)
+    return score if wdl > 0 else -score
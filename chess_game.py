@@ -1,13 +1,57 @@
-import pygame
-import chess
+import importlib.util
+import os
 import sys
 import time
 import queue
 import threading
 import math
-import random
 import array
 import socket
+import struct
+
+import chess
+
+# Движок не зависит от pygame: тесты, uci.py и утилиты импортируют chess_engine напрямую
+from chess_engine import (
+    DEFAULT_BOOK,
+    MAX_SEARCH_DEPTH,
+    PARALLEL_OPTIONS,
+    ParallelSearch,
+    SearchContext,
+    TranspositionTable,
+    allocate_time,
+    find_best_move,
+    get_opening_move,
+    iterative_deepening,
+    multipv_search,
+    zobrist_hash,
+)
+# Функции движка, которые раньше жили здесь: старый код импортирует их из chess_game
+from chess_engine import PIECE_VALUES, evaluate_board, minimax, order_moves  # noqa: F401
+
+
+def _lazy_import(name):
+    """
+    Модуль, который загружается при первом обращении к атрибуту
+
+    Импорт pygame (SDL, приветствие в stdout) занимает больше половины времени
+    запуска, а в режиме --uci окно не нужно вовсе
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# Приветствие pygame в stdout мешает UCI-режиму
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+pygame = _lazy_import("pygame")
 
 # ==========================================
 # 1. ГЕНЕРАТОР ЗВУКА (Синтезатор)
@@ -70,12 +114,60 @@ class SoundManager:
 # 2. СЕТЕВОЙ МЕНЕДЖЕР (LAN)
 # ==========================================
 
+# Протокол: кадр = заголовок FRAME_HEADER (длина данных, тип, номер) + данные.
+# TCP может склеить или разрезать посылки - границы сообщений задаёт длина
+FRAME_HEADER = struct.Struct(">HBI")
+MSG_MOVE = 1     # ход в UCI, "e2e4"
+MSG_CLOCK = 2    # часы белых и чёрных в миллисекундах, CLOCK_PAYLOAD
+MSG_RESIGN = 3   # соперник сдался (или вышел в меню)
+MSG_PING = 4     # метка времени отправителя, PING_PAYLOAD
+MSG_PONG = 5     # ответ на PING с той же меткой
+CLOCK_PAYLOAD = struct.Struct(">II")
+PING_PAYLOAD = struct.Struct(">d")
+PING_INTERVAL = 2.0
+
+def encode_frame(msg_type, seq, payload=b""):
+    return FRAME_HEADER.pack(len(payload), msg_type, seq) + payload
+
+class FrameReader:
+    """Собирает кадры из потока байтов, пришедшего произвольными кусками"""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Returns:
+            Список полностью пришедших кадров (тип, номер, данные); хвост ждёт следующих байтов
+        """
+        self.buffer += data
+        frames = []
+        pos = 0
+        while len(self.buffer) - pos >= FRAME_HEADER.size:
+            length, msg_type, seq = FRAME_HEADER.unpack_from(self.buffer, pos)
+            end = pos + FRAME_HEADER.size + length
+            if end > len(self.buffer): break
+            frames.append((msg_type, seq, bytes(self.buffer[pos + FRAME_HEADER.size:end])))
+            pos = end
+        del self.buffer[:pos]
+        return frames
+
 class NetworkManager:
+    """
+    Игра по сети. В очередь игры (game.post) приходят пары (вид, данные):
+    ("HOST_READY" | "CLIENT_READY" | "DISCONNECT" | "RESIGN", None),
+    ("MOVE", uci), ("CLOCK", (секунды белых, секунды чёрных))
+    """
     def __init__(self, game_instance):
         self.game = game_instance
         self.client_socket = None
+        self.server = None
         self.connected = False
         self.running = True
+        self.send_lock = threading.Lock()
+        self.send_seq = 0
+        self.recv_seq = 0
+        # Время кругового пути последнего PING (секунды) или None
+        self.rtt = None
 
     def get_local_ip(self):
         try:
@@ -88,240 +180,117 @@ class NetworkManager:
             return "127.0.0.1"
 
     def host_game(self, port=5555):
+        """Открывает порт (0 - любой свободный) и ждёт соперника в фоне; возвращает порт или None"""
+        try:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(('0.0.0.0', port))
+            server.listen(1)
+        except OSError: return None
+        self.server = server
         def server_thread():
             try:
-                server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                server.bind(('0.0.0.0', port))
-                server.listen(1)
                 conn, addr = server.accept()
-                self.client_socket = conn
-                self.connected = True
-                self.game.network_queue.put("HOST_READY")
-                self.start_receiving()
-            except: pass
+                self.on_connected(conn, "HOST_READY")
+            except OSError: pass
+            finally: server.close()
         threading.Thread(target=server_thread, daemon=True).start()
+        return server.getsockname()[1]
 
     def connect_to_game(self, ip, port=5555):
         try:
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((ip, port))
-            self.connected = True
-            self.game.network_queue.put("CLIENT_READY")
-            self.start_receiving()
+            sock = socket.create_connection((ip, port), timeout=5)
+            sock.settimeout(None)
+            self.on_connected(sock, "CLIENT_READY")
             return True
-        except: return False
-
-    def send_move(self, move_uci):
-        if self.connected and self.client_socket:
-            try: self.client_socket.send(move_uci.encode('utf-8'))
-            except: self.connected = False
+        except OSError: return False
 
-    def start_receiving(self):
+    def on_connected(self, sock, event):
+        # Ходы - посылки в десяток байт: без NODELAY алгоритм Нейгла держит их до ACK
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.client_socket = sock
+        self.send_seq = self.recv_seq = 0
+        self.rtt = None
+        self.connected = True
+        self.game.post(self.game.network_queue, (event, None))
         threading.Thread(target=self.receive_loop, daemon=True).start()
+        threading.Thread(target=self.ping_loop, daemon=True).start()
 
-    def receive_loop(self):
-        while self.running and self.connected:
-            try:
-                data = self.client_socket.recv(1024)
-                if not data: break
-                self.game.network_queue.put(data.decode('utf-8'))
-            except: break
-        self.connected = False
-        self.game.network_queue.put("DISCONNECT")
+    def send(self, msg_type, payload=b""):
+        if not (self.connected and self.client_socket): return
+        with self.send_lock:
+            self.send_seq += 1
+            try: self.client_socket.sendall(encode_frame(msg_type, self.send_seq, payload))
+            except OSError: self.connected = False
 
-# ==========================================
-# 3. ШАХМАТНЫЙ ДВИЖОК (Полный)
-# ==========================================
+    def send_move(self, move_uci):
+        self.send(MSG_MOVE, move_uci.encode('utf-8'))
 
-OPENING_BOOK = {
-    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1': ['e2e4', 'd2d4', 'g1f3', 'c2c4'],
-    'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1': ['e7e5', 'c7c5', 'e7e6', 'c7c6'],
-    'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2': ['g1f3', 'f1c4', 'b1c3'],
-    'rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq - 0 1': ['d7d5', 'g8f6', 'e7e6', 'c7c5'],
-}
-
-def get_opening_move(board):
-    fen = board.fen()
-    if fen in OPENING_BOOK:
-        try: return chess.Move.from_uci(random.choice(OPENING_BOOK[fen]))
-        except: pass
-    return None
+    def send_clock(self, time_white, time_black):
+        self.send(MSG_CLOCK, CLOCK_PAYLOAD.pack(max(0, int(time_white * 1000)), max(0, int(time_black * 1000))))
 
-PIECE_VALUES = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 20000}
+    def send_resign(self):
+        self.send(MSG_RESIGN)
 
-PAWN_TABLE = [0,0,0,0,0,0,0,0, 50,50,50,50,50,50,50,50, 10,10,20,30,30,20,10,10, 5,5,10,25,25,10,5,5, 0,0,0,20,20,0,0,0, 5,-5,-10,0,0,-10,-5,5, 5,10,10,-20,-20,10,10,5, 0,0,0,0,0,0,0,0]
-KNIGHT_TABLE = [-50,-40,-30,-30,-30,-30,-40,-50, -40,-20,0,5,5,0,-20,-40, -30,5,10,15,15,10,5,-30, -30,0,15,20,20,15,0,-30, -30,5,15,20,20,15,5,-30, -30,0,10,15,15,10,0,-30, -40,-20,0,0,0,0,-20,-40, -50,-40,-30,-30,-30,-30,-40,-50]
-BISHOP_TABLE = [-20,-10,-10,-10,-10,-10,-10,-20, -10,5,0,0,0,0,5,-10, -10,10,10,10,10,10,10,-10, -10,0,10,10,10,10,0,-10, -10,5,5,10,10,5,5,-10, -10,0,5,10,10,5,0,-10, -10,0,0,0,0,0,0,-10, -20,-10,-10,-10,-10,-10,-10,-20]
-ROOK_TABLE = [0,0,0,5,5,0,0,0, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, -5,0,0,0,0,0,0,-5, 5,10,10,10,10,10,10,5, 0,0,0,0,0,0,0,0]
-QUEEN_TABLE = [-20,-10,-10,-5,-5,-10,-10,-20, -10,0,5,0,0,0,0,-10, -10,5,5,5,5,5,0,-10, 0,0,5,5,5,5,0,-5, -5,0,5,5,5,5,0,-5, -10,0,5,5,5,5,0,-10, -10,0,0,0,0,0,0,-10, -20,-10,-10,-5,-5,-10,-10,-20]
-KING_TABLE = [20,30,10,0,0,10,30,20, 20,20,0,0,0,0,20,20, -10,-20,-20,-20,-20,-20,-20,-10, -20,-30,-30,-40,-40,-30,-30,-20, -30,-40,-40,-50,-50,-40,-40,-30, -30,-40,-40,-50,-50,-40,-40,-30, -30,-40,-40,-50,-50,-40,-40,-30, -30,-40,-40,-50,-50,-40,-40,-30]
+    def ping(self):
+        self.send(MSG_PING, PING_PAYLOAD.pack(time.perf_counter()))
 
-TABLES = {chess.PAWN: PAWN_TABLE, chess.KNIGHT: KNIGHT_TABLE, chess.BISHOP: BISHOP_TABLE, chess.ROOK: ROOK_TABLE, chess.QUEEN: QUEEN_TABLE, chess.KING: KING_TABLE}
+    def ping_loop(self):
+        sock = self.client_socket
+        while self.running and self.connected and self.client_socket is sock:
+            self.ping()
+            time.sleep(PING_INTERVAL)
 
-def evaluate_board(board):
-    """
-    Оценивает позицию на доске
-    Положительное значение = хорошо для белых
-    Отрицательное значение = хорошо для чёрных
-    """
-    if board.is_checkmate(): 
-        return -99999 if board.turn else 99999
-    if board.is_stalemate() or board.is_insufficient_material(): 
-        return 0
-    
-    score = 0
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if not piece: 
-            continue
-        
-        val = PIECE_VALUES[piece.piece_type]
-        table = TABLES[piece.piece_type]
-        pos = square if piece.color == chess.WHITE else chess.square_mirror(square)
-        
-        if piece.color == chess.WHITE: 
-            score += val + table[pos]
-        else: 
-            score -= val + table[pos]
-    
-    return score
+    def close(self):
+        self.connected = False
+        for sock in (self.client_socket, self.server):
+            if sock is None: continue
+            try: sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            sock.close()
+        self.client_socket = self.server = None
 
+    def receive_loop(self):
+        sock = self.client_socket
+        reader = FrameReader()
+        while self.running and self.connected:
+            try:
+                data = sock.recv(4096)
+                if not data: break
+            except OSError: break
+            try:
+                for msg_type, seq, payload in reader.feed(data):
+                    # Номера растут на единицу; повтор или старый кадр пропускаем
+                    if seq <= self.recv_seq: continue
+                    self.recv_seq = seq
+                    self.handle_frame(msg_type, payload)
+            except (struct.error, UnicodeDecodeError, ValueError):
+                # Испорченный кадр: соперник говорит не на нашем протоколе - рвём связь,
+                # чтобы он тоже это увидел, а игра получила DISCONNECT
+                try: sock.shutdown(socket.SHUT_RDWR)
+                except OSError: pass
+                break
+        if self.client_socket is sock:
+            self.connected = False
+            self.game.post(self.game.network_queue, ("DISCONNECT", None))
 
-def find_best_move(board, depth):
-    """
-    Находит лучший ход для текущей позиции
-    
-    Args:
-        board: Шахматная доска
-        depth: Глубина поиска
-        
-    Returns:
-        chess.Move или None если нет легальных ходов
-    """
-    # Проверка на наличие легальных ходов
-    legal_moves = list(board.legal_moves)
-    if not legal_moves:
-        return None
-    
-    # Если всего один ход - возвращаем его
-    if len(legal_moves) == 1:
-        return legal_moves[0]
-    
-    best_move = None
-    max_turn = board.turn == chess.WHITE
-    best_eval = -999999 if max_turn else 999999
-    alpha, beta = -999999, 999999
-    
-    # Упорядочиваем ходы для лучшей производительности
-    moves = order_moves(board, legal_moves)
-    
-    for move in moves:
-        board.push(move)
-        eval_score = minimax(board, depth-1, alpha, beta, not max_turn)
-        board.pop()
-        
-        if max_turn:
-            if eval_score > best_eval:
-                best_eval = eval_score
-                best_move = move
-            alpha = max(alpha, eval_score)
-        else:
-            if eval_score < best_eval:
-                best_eval = eval_score
-                best_move = move
-            beta = min(beta, eval_score)
-        
-        # Alpha-beta отсечение
-        if beta <= alpha:
-            break
-    
-    return best_move
-
-def order_moves(board, moves):
-    def score(m):
-        if board.is_capture(m):
-            attacker = board.piece_at(m.from_square)
-            victim = board.piece_at(m.to_square)
-            if attacker and victim:
-                return PIECE_VALUES[victim.piece_type]*10 - PIECE_VALUES[attacker.piece_type]
-        if board.gives_check(m): return 500
-        if m.promotion: return 800
-        return 0
-    return sorted(moves, key=score, reverse=True)
-
-def minimax(board, depth, alpha, beta, maximizing):
-    if depth == 0 or board.is_game_over(): return evaluate_board(board)
-    moves = order_moves(board, list(board.legal_moves))
-    if maximizing:
-        max_eval = -999999
-        for move in moves:
-            board.push(move)
-            eval = minimax(board, depth-1, alpha, beta, False)
-            board.pop()
-            max_eval = max(max_eval, eval)
-            alpha = max(alpha, eval)
-            if beta <= alpha: break
-        return max_eval
-    else:
-        min_eval = 999999
-        for move in moves:
-            board.push(move)
-            eval = minimax(board, depth-1, alpha, beta, True)
-            board.pop()
-            min_eval = min(min_eval, eval)
-            beta = min(beta, eval)
-            if beta <= alpha: break
-        return min_eval
-
-def find_best_move(board, depth):
-    """
-    Находит лучший ход для текущей позиции
-    
-    Args:
-        board: Шахматная доска
-        depth: Глубина поиска
-        
-    Returns:
-        chess.Move или None если нет легальных ходов
-    """
-    # Проверка на наличие легальных ходов
-    legal_moves = list(board.legal_moves)
-    if not legal_moves:
-        return None
-    
-    # Если всего один ход - возвращаем его
-    if len(legal_moves) == 1:
-        return legal_moves[0]
-    
-    best_move = None
-    max_turn = board.turn == chess.WHITE
-    best_eval = -999999 if max_turn else 999999
-    alpha, beta = -999999, 999999
-    
-    # Упорядочиваем ходы для лучшей производительности
-    moves = order_moves(board, legal_moves)
-    
-    for move in moves:
-        board.push(move)
-        eval_score = minimax(board, depth-1, alpha, beta, not max_turn)
-        board.pop()
-        
-        if max_turn:
-            if eval_score > best_eval:
-                best_eval = eval_score
-                best_move = move
-            alpha = max(alpha, eval_score)
-        else:
-            if eval_score < best_eval:
-                best_eval = eval_score
-                best_move = move
-            beta = min(beta, eval_score)
-        
-        # Alpha-beta отсечение
-        if beta <= alpha:
-            break
-    
-    return best_move
+    def handle_frame(self, msg_type, payload):
+        if msg_type == MSG_PING:
+            # Отвечаем прямо из потока приёма, не дожидаясь кадра игры
+            self.send(MSG_PONG, payload)
+        elif msg_type == MSG_PONG:
+            self.rtt = time.perf_counter() - PING_PAYLOAD.unpack(payload)[0]
+        elif msg_type == MSG_MOVE:
+            self.game.post(self.game.network_queue, ("MOVE", payload.decode('utf-8')))
+        elif msg_type == MSG_CLOCK:
+            white_ms, black_ms = CLOCK_PAYLOAD.unpack(payload)
+            self.game.post(self.game.network_queue, ("CLOCK", (white_ms / 1000, black_ms / 1000)))
+        elif msg_type == MSG_RESIGN:
+            self.game.post(self.game.network_queue, ("RESIGN", None))
+
+# ==========================================
+# 3. ШАХМАТНЫЙ ДВИЖОК - см. chess_engine.py
+# ==========================================
 
 # ==========================================
 # 4. ИНТЕРФЕЙС
@@ -334,6 +303,14 @@ BOARD_X, BOARD_Y = 30, 30
 PANEL_X = BOARD_X + BOARD_SIZE + 30
 PANEL_WIDTH = WIDTH - PANEL_X - 20
 FPS = 60
+# Длительность анимации хода, секунд
+ANIMATION_TIME = 0.5
+# Когда экран не меняется, часы стоят и ИИ не думает, цикл просыпается реже
+IDLE_FPS = 10
+IDLE_DELAY = 1.0
+# Области перерисовки: доска с координатами и правая панель
+BOARD_AREA = (0, 0, PANEL_X - 10, HEIGHT)
+PANEL_AREA = (PANEL_X - 10, 0, WIDTH - PANEL_X + 10, HEIGHT)
 
 THEMES = [
     {"name": "Классика", "light": (238,238,210), "dark": (118,150,86), "highlight": (186,202,68)},
@@ -392,8 +369,127 @@ class InputBox:
         pygame.draw.rect(screen, self.color, self.rect, 2)
         screen.blit(txt, (self.rect.x+5, self.rect.y+8))
 
-class ChessGame:
+class RenderCache:
+    """
+    Заранее отрисованные поверхности для доски и фигур: спрайты фигур (глиф с тенью),
+    слой доски с координатами для пары (тема, сторона) и полупрозрачные накладки.
+    Создаётся после set_mode - поверхности приводятся к формату экрана
+    """
+    LABEL_COLOR = (180,180,180)
+    PIECE_COLORS = {chess.WHITE: (WHITE_COL, (50,50,50), (2,2)), chess.BLACK: ((10,10,10), (200,200,200), (-1,-1))}
+    SYMBOLS = {'r':'♜', 'n':'♞', 'b':'♝', 'q':'♛', 'k':'♚', 'p':'♟',
+               'R':'♖', 'N':'♘', 'B':'♗', 'Q':'♕', 'K':'♔', 'P':'♙'}
+
+    def __init__(self, font_pieces, font_coord):
+        self.font_pieces = font_pieces
+        self.font_coord = font_coord
+        self.sprites = {}
+        self.overlays = {}
+        # Слой доски один: пересобирается, только когда меняются тема или сторона
+        self.board_key = None
+        self.board_layer = None
+
+    def piece(self, symbol):
+        """Спрайт фигуры SQUARE_SIZE x SQUARE_SIZE (symbol как у chess.Piece.symbol())"""
+        sprite = self.sprites.get(symbol)
+        if sprite is None:
+            color, shadow_color, off = self.PIECE_COLORS[symbol.isupper()]
+            glyph = self.font_pieces.render(self.SYMBOLS[symbol], True, color)
+            shadow = self.font_pieces.render(self.SYMBOLS[symbol], True, shadow_color)
+            sprite = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+            r = glyph.get_rect(center=(SQUARE_SIZE//2, SQUARE_SIZE//2))
+            sprite.blit(shadow, (r.x+off[0], r.y+off[1]))
+            sprite.blit(glyph, r)
+            sprite = self.sprites[symbol] = sprite.convert_alpha()
+        return sprite
+
+    def board(self, theme_idx, side):
+        """Клетки и подписи координат; блитится в (0, 0)"""
+        if self.board_key != (theme_idx, side):
+            theme = THEMES[theme_idx]
+            layer = pygame.Surface((BOARD_X + BOARD_SIZE, BOARD_Y + BOARD_SIZE + 25))
+            layer.fill(BG_COLOR)
+            numbers = "12345678" if side == chess.BLACK else "87654321"
+            letters = "HGFEDCBA" if side == chess.BLACK else "ABCDEFGH"
+            for i in range(8):
+                lbl = self.font_coord.render(numbers[i], True, self.LABEL_COLOR)
+                layer.blit(lbl, (BOARD_X-18, BOARD_Y+i*SQUARE_SIZE+SQUARE_SIZE//2-8))
+                lbl = self.font_coord.render(letters[i], True, self.LABEL_COLOR)
+                layer.blit(lbl, (BOARD_X+i*SQUARE_SIZE+SQUARE_SIZE//2-5, BOARD_Y+BOARD_SIZE+5))
+            for r in range(8):
+                for c in range(8):
+                    color = theme["light"] if (r+c)%2==0 else theme["dark"]
+                    layer.fill(color, (BOARD_X+c*SQUARE_SIZE, BOARD_Y+r*SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+            self.board_layer = layer.convert()
+            self.board_key = (theme_idx, side)
+        return self.board_layer
+
+    def highlight(self, color):
+        """Подсветка клетки последнего хода"""
+        key = ("highlight", color)
+        surface = self.overlays.get(key)
+        if surface is None:
+            surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE)).convert()
+            surface.fill(color)
+            surface.set_alpha(140)
+            self.overlays[key] = surface
+        return surface
+
+    def dim(self):
+        """Затемнение всего окна под диалогами"""
+        surface = self.overlays.get("dim")
+        if surface is None:
+            surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+            surface.fill((0,0,0,180))
+            surface = self.overlays["dim"] = surface.convert_alpha()
+        return surface
+
+class MoveTween:
+    """
+    Полёт спрайта фигуры с клетки на клетку. Ход к этому моменту уже сделан на доске,
+    кадры рисует главный цикл, поэтому очереди, часы и ввод во время анимации не стоят
+    """
+    def __init__(self, symbol, square, start_pos, end_pos, duration, captured=None):
+        self.symbol = symbol
+        # Клетка назначения: фигура на ней рисуется твином, пока он не закончится
+        self.square = square
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        self.duration = duration
+        # Взятая фигура остаётся на клетке, пока до неё не долетит бьющая
+        self.captured = captured
+        self.start = time.time()
+
+    def done(self, now):
+        return now - self.start >= self.duration
+
+    def position(self, now):
+        t = min(1.0, (now - self.start) / self.duration) if self.duration > 0 else 1.0
+        progress = math.sin(t * math.pi/2)
+        (fx, fy), (tx, ty) = self.start_pos, self.end_pos
+        return fx + (tx-fx)*progress, fy + (ty-fy)*progress
+
+class LatencyMeter:
+    """Задержки сообщений очереди: от put в рабочем потоке до обработки в главном цикле"""
     def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self):
+        return f"{self.count} сообщ., среднее {self.mean*1000:.1f} мс, макс {self.max*1000:.1f} мс"
+
+class ChessGame:
+    def __init__(self, search_workers=1, show_stats=False):
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.DOUBLEBUF)
         pygame.display.set_caption("Шахматы v22.1 (Full Logic + LAN + Promotion)")
@@ -413,26 +509,62 @@ class ChessGame:
         self.state = "MENU"
         self.player_side = chess.WHITE
         self.current_theme_idx = 0
-        self.animation_speed = 0.5
+        self.animation_speed = ANIMATION_TIME
+        # Идущие анимации ходов (MoveTween), могут перекрываться
+        self.animations = []
         self.last_eval = 0
         
         self.show_hints = False
         self.hint_moves = []
+        # Линии подсказки (ход, оценка, PV) и кэш: (ключ позиции, глубина, линии)
+        self.hint_lines = []
+        self.hint_cache = None
         self.is_calculating_hints = False
         self.timer_enabled = False
+        self.timer_mode = None
         self.timer_running = False
         self.time_white = 0
         self.time_black = 0
+        self.time_increment = 0
         self.last_timer_update = 0
         self.is_lan_mode = False
         
         self.ai_queue = queue.Queue()
         self.hint_queue = queue.Queue()
+        # Сообщения в очередях кладутся через post: метка времени для замера задержки
+        # и событие pygame, которое будит главный цикл, спящий в pygame.event.wait
+        self.wake_event = pygame.event.custom_type()
+        self.queue_handlers = [(self.ai_queue, self.on_ai_move, "ai"),
+                               (self.hint_queue, self.on_hint_lines, "hint"),
+                               (self.network_queue, self.on_network_message, "network")]
+        self.queue_latency = {name: LatencyMeter() for _, _, name in self.queue_handlers}
+        # --stats: сводка задержек очередей при выходе
+        self.show_stats = show_stats
+        
+        # Таблица транспозиций общая для ИИ и подсказок, живёт всю партию
+        self.search_ctx = SearchContext(TranspositionTable())
+        # Больше одного процесса - ходы корня считаются параллельно (без часов)
+        self.search_workers = search_workers
+        self.parallel_search = None
+        # Поколение позиции: результаты поисков, начатых в другом поколении, отбрасываются
+        self.search_generation = 0
+        self.search_tokens = {}
+        # Обдумывание на времени соперника: ожидаемый ответ и лучший ход на него
+        self.ponder_enabled = True
+        self.ponder_move = None
+        self.ponder_result = None
         
         # Диалог превращения пешки
         self.promotion_dialog = None
         self.pending_promotion_move = None
         
+        # Перерисовка по изменениям: ключи состояния областей на прошлом кадре
+        self.frame_keys = {}
+        self.last_activity = time.time()
+        # События окна, после которых его содержимое нужно нарисовать заново
+        self.redraw_events = {pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWSHOWN,
+                              pygame.WINDOWRESTORED, pygame.WINDOWSIZECHANGED}
+        
         try:
             self.font_pieces = pygame.font.SysFont("segoeuisymbol", int(SQUARE_SIZE * 0.8))
             self.font_ui = pygame.font.SysFont("arial", 18, bold=True)
@@ -446,8 +578,8 @@ class ChessGame:
             self.font_small = pygame.font.SysFont("arial", 14)
             self.font_coord = pygame.font.SysFont("arial", 13)
         
-        self.pieces_symbols = {'r':'♜', 'n':'♞', 'b':'♝', 'q':'♛', 'k':'♚', 'p':'♟',
-                               'R':'♖', 'N':'♘', 'B':'♗', 'Q':'♕', 'K':'♔', 'P':'♙'}
+        self.pieces_symbols = RenderCache.SYMBOLS
+        self.render_cache = RenderCache(self.font_pieces, self.font_coord)
         
         self.init_ui()
 
@@ -494,8 +626,54 @@ class ChessGame:
         if self.player_side == chess.BLACK: col, row = 7-col, 7-row
         return chess.square(col, 7-row)
 
+    def start_search(self, kind, target):
+        """
+        Запускает фоновый поиск (kind: "ai" или "hint"); предыдущий поиск того же
+        вида сразу прерывается. target получает номер поколения и флаг отмены
+        """
+        old = self.search_tokens.get(kind)
+        if old is not None: old.set()
+        stop = threading.Event()
+        self.search_tokens[kind] = stop
+        threading.Thread(target=target, args=(self.search_generation, stop), daemon=True).start()
+
+    def cancel_searches(self):
+        """Позиция изменилась: все фоновые поиски прерываются, их результаты устаревают"""
+        self.search_generation += 1
+        for stop in self.search_tokens.values(): stop.set()
+        self.search_tokens = {}
+        self.ponder_move = None
+        self.ponder_result = None
+        self.is_thinking = False
+        self.is_calculating_hints = False
+
+    def start_pondering(self):
+        """После хода ИИ думаем над позицией после ожидаемого ответа (второй ход PV)"""
+        if not self.ponder_enabled or self.is_lan_mode or self.game_over_flag: return
+        pv = self.search_ctx.pv
+        if len(pv) < 2 or not self.board.move_stack or pv[0] != self.board.peek(): return
+        if pv[1] not in self.board.legal_moves: return
+        self.ponder_move = pv[1]
+        self.ponder_result = None
+        self.start_search("ponder", self.run_ponder)
+
+    def run_ponder(self, generation, stop):
+        try:
+            ponder_move = self.ponder_move
+            board = self.board.copy()
+            board.push(ponder_move)
+            ctx = self.search_ctx.fork(stop)
+            def on_iteration(depth, move, score, ctx):
+                if not stop.is_set(): self.ponder_result = (ponder_move, move, depth)
+            # Без часов достаточно глубины уровня, с часами - думаем, пока соперник не сходит
+            max_depth = MAX_SEARCH_DEPTH if self.timer_enabled else self.ai_depth
+            iterative_deepening(board, max_depth, None, ctx, on_iteration)
+        except: pass
+
     def start_game(self, color, mode="AI"):
+        self.cancel_searches()
         self.board = chess.Board()
+        self.animations = []
         self.selected_square = None
         self.history = []
         self.game_over_flag = False
@@ -507,6 +685,7 @@ class ChessGame:
         self.hint_moves = []
         self.promotion_dialog = None
         self.pending_promotion_move = None
+        self.search_ctx.tt.clear()
         
         # Таймер
         if self.timer_enabled:
@@ -525,33 +704,17 @@ class ChessGame:
             else:
                 self.game_status = "ИИ думает..."
                 self.is_thinking = True
-                threading.Thread(target=self.run_ai, daemon=True).start()
+                self.start_search("ai", self.run_ai)
 
     def draw_board(self):
-        theme = THEMES[self.current_theme_idx]
-        light, dark, highlight = theme["light"], theme["dark"], theme["highlight"]
-        
-        for i in range(8):
-            num = str(i+1) if self.player_side == chess.BLACK else str(8-i)
-            lbl = self.font_coord.render(num, True, (180,180,180))
-            self.screen.blit(lbl, (BOARD_X-18, BOARD_Y+i*SQUARE_SIZE+SQUARE_SIZE//2-8))
-            let = "HGFEDCBA" if self.player_side == chess.BLACK else "ABCDEFGH"
-            lbl2 = self.font_coord.render(let[i], True, (180,180,180))
-            self.screen.blit(lbl2, (BOARD_X+i*SQUARE_SIZE+SQUARE_SIZE//2-5, BOARD_Y+BOARD_SIZE+5))
-
-        for r in range(8):
-            for c in range(8):
-                color = light if (r+c)%2==0 else dark
-                pygame.draw.rect(self.screen, color, (BOARD_X+c*SQUARE_SIZE, BOARD_Y+r*SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+        cache = self.render_cache
+        self.screen.blit(cache.board(self.current_theme_idx, self.player_side), (0, 0))
         
         if len(self.board.move_stack) > 0:
             last = self.board.peek()
+            s = cache.highlight(THEMES[self.current_theme_idx]["highlight"])
             for sq in [last.from_square, last.to_square]:
-                x, y = self.to_screen(sq)
-                s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
-                s.set_alpha(140)
-                s.fill(highlight)
-                self.screen.blit(s, (x,y))
+                self.screen.blit(s, self.to_screen(sq))
         
         if self.selected_square is not None:
             x, y = self.to_screen(self.selected_square)
@@ -576,20 +739,16 @@ class ChessGame:
                 x, y = self.to_screen(k)
                 pygame.draw.rect(self.screen, (255,80,80), (x, y, SQUARE_SIZE, SQUARE_SIZE), 6)
 
-    def draw_pieces(self, skip=None):
-        for sq in chess.SQUARES:
-            if sq == skip: continue
-            piece = self.board.piece_at(sq)
-            if piece:
-                x, y = self.to_screen(sq)
-                sym = self.pieces_symbols[piece.symbol()]
-                col = WHITE_COL if piece.color == chess.WHITE else (10,10,10)
-                txt = self.font_pieces.render(sym, True, col)
-                r = txt.get_rect(center=(x+SQUARE_SIZE//2, y+SQUARE_SIZE//2))
-                shad = self.font_pieces.render(sym, True, (50,50,50) if piece.color==chess.WHITE else (200,200,200))
-                off = (2,2) if piece.color==chess.WHITE else (-1,-1)
-                self.screen.blit(shad, (r.x+off[0], r.y+off[1]))
-                self.screen.blit(txt, r)
+    def draw_pieces(self):
+        cache = self.render_cache
+        now = time.time()
+        piece_map = self.board.piece_map()
+        for tween in self.animations: piece_map.pop(tween.square, None)
+        sprites = [(cache.piece(piece.symbol()), self.to_screen(sq)) for sq, piece in piece_map.items()]
+        sprites += [(cache.piece(tween.captured), self.to_screen(tween.square))
+                    for tween in self.animations if tween.captured]
+        sprites += [(cache.piece(tween.symbol), tween.position(now)) for tween in self.animations]
+        self.screen.blits(sprites, False)
 
     def draw_promotion_dialog(self):
         """Диалог выбора фигуры при превращении пешки"""
@@ -597,9 +756,7 @@ class ChessGame:
             return
         
         # Затемнение фона
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.render_cache.dim(), (0, 0))
         
         # Параметры диалога
         dialog_w, dialog_h = 400, 200
@@ -665,6 +822,9 @@ class ChessGame:
         st_col = (150, 255, 150) if not "МАТ" in self.game_status else (255,100,100)
         st = self.font_ui.render(self.game_status[:25], True, st_col)
         self.screen.blit(st, (PANEL_X+10, base_y)) 
+        if self.is_lan_mode and self.network.rtt is not None:
+            ping = self.font_small.render(f"Пинг: {self.network.rtt*1000:.0f} мс", True, (150,150,150))
+            self.screen.blit(ping, (PANEL_X+10, base_y+22))
         
         # Кнопки
         self.btn_hint.rect.y = base_y + 40
@@ -733,69 +893,170 @@ class ChessGame:
         
         self.menu_btn_quit.draw(self.screen, self.font_ui)
 
-    def animate_move(self, move):
-        fx, fy = self.to_screen(move.from_square)
-        tx, ty = self.to_screen(move.to_square)
-        piece = self.board.piece_at(move.from_square)
-        if not piece: return
-        pygame.event.pump()
-        start = time.time()
-        while True:
-            elapsed = time.time() - start
-            if elapsed > self.animation_speed: break
-            progress = math.sin(min(1.0, elapsed/self.animation_speed) * math.pi/2)
-            cx, cy = fx + (tx-fx)*progress, fy + (ty-fy)*progress
-            
-            self.screen.fill(BG_COLOR)
+    def draw_game_over(self):
+        self.screen.blit(self.render_cache.dim(), (0,0))
+        txt = self.font_title.render(self.game_status, True, (255,200,100))
+        self.screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT//2-50)))
+        self.go_btn_menu.draw(self.screen, self.font_ui)
+
+    def hovered(self, rects):
+        """Номер прямоугольника под курсором или None - подсветка кнопок входит в ключи кадра"""
+        pos = pygame.mouse.get_pos()
+        for i, rect in enumerate(rects):
+            if rect.collidepoint(pos): return i
+        return None
+
+    def view_keys(self):
+        """
+        Всё, от чего зависит картинка каждой области. Область перерисовывается,
+        только если её ключ отличается от ключа прошлого кадра
+        """
+        if self.state == "MENU":
+            buttons = [self.menu_btn_white, self.menu_btn_black, self.menu_btn_no_timer, self.menu_btn_blitz,
+                       self.menu_btn_rapid, self.menu_btn_host, self.menu_btn_connect, self.menu_btn_quit]
+            return {"menu": (self.hovered([b.rect for b in buttons]), self.input_ip.text, self.input_ip.active,
+                             self.timer_enabled, self.timer_mode, self.game_status)}
+        board = self.board
+        now = time.time()
+        keys = {
+            "board": (board.fen(), board.move_stack[-1] if board.move_stack else None, self.selected_square,
+                      self.current_theme_idx, self.player_side, self.show_hints, tuple(self.hint_moves[:3]),
+                      tuple(tween.position(now) for tween in self.animations)),
+            "panel": (int(self.time_white), int(self.time_black), board.turn, self.timer_enabled, self.game_status,
+                      self.is_calculating_hints, self.show_hints, self.sound_manager.enabled, self.ai_depth,
+                      round(self.network.rtt * 1000) if self.is_lan_mode and self.network.rtt is not None else None,
+                      tuple(self.history[-6:]),
+                      self.hovered([b.rect for b in (self.btn_hint, self.btn_undo, self.btn_new, self.btn_theme,
+                                                     self.btn_sound, self.btn_level_down, self.btn_level_up,
+                                                     self.btn_quit)])),
+        }
+        if self.promotion_dialog:
+            keys["overlay"] = ("promotion", board.turn, self.hovered(list(self.promotion_dialog['buttons'].values())))
+        elif self.game_over_flag:
+            keys["overlay"] = ("game_over", self.game_status, self.hovered([self.go_btn_menu.rect]))
+        return keys
+
+    def render(self):
+        """
+        Перерисовывает изменившиеся области
+
+        Returns:
+            Прямоугольники для pygame.display.update (пустой список - кадр не изменился)
+        """
+        keys = self.view_keys()
+        changed = {name for name, key in keys.items() if self.frame_keys.get(name) != key}
+        # Новый экран, диалог открылся или закрылся - рисуем всё окно
+        full = keys.keys() != self.frame_keys.keys()
+        if not changed and not full: return []
+        self.frame_keys = keys
+        if self.state == "MENU":
+            self.draw_menu()
+            return [self.screen.get_rect()]
+        
+        dirty = []
+        if full or "board" in changed or "overlay" in keys:
+            self.screen.fill(BG_COLOR, BOARD_AREA)
             self.draw_board()
-            self.draw_pieces(skip=move.from_square)
+            self.draw_pieces()
+            dirty.append(pygame.Rect(BOARD_AREA))
+        if full or "panel" in changed or "overlay" in keys:
+            self.screen.fill(BG_COLOR, PANEL_AREA)
             self.draw_panel()
-            
-            sym = self.pieces_symbols[piece.symbol()]
-            col = WHITE_COL if piece.color == chess.WHITE else (10,10,10)
-            txt = self.font_pieces.render(sym, True, col)
-            self.screen.blit(txt, txt.get_rect(center=(cx+SQUARE_SIZE//2, cy+SQUARE_SIZE//2)))
-            pygame.display.flip()
-            self.clock.tick(60)
+            dirty.append(pygame.Rect(PANEL_AREA))
+        # Полупрозрачные диалоги лежат поверх обеих областей
+        if self.promotion_dialog:
+            self.draw_promotion_dialog()
+            return [self.screen.get_rect()]
+        if self.game_over_flag:
+            self.draw_game_over()
+            return [self.screen.get_rect()]
+        return dirty
+
+    def start_animation(self, move):
+        """Запускает анимацию хода; вызывается до board.push(move)"""
+        piece = self.board.piece_at(move.from_square)
+        if not piece: return
+        # Фигура, которая ещё летит на from_square, сразу встаёт на место
+        self.animations = [t for t in self.animations if t.square != move.from_square]
+        captured = self.board.piece_at(move.to_square)
+        self.animations.append(MoveTween(piece.symbol(), move.to_square, self.to_screen(move.from_square),
+                                         self.to_screen(move.to_square), self.animation_speed,
+                                         captured.symbol() if captured else None))
+        if self.board.is_castling(move):
+            # Ладья летит одновременно с королём
+            rank = chess.square_rank(move.from_square)
+            kingside = chess.square_file(move.to_square) > chess.square_file(move.from_square)
+            rook_from = chess.square(7 if kingside else 0, rank)
+            rook_to = chess.square(5 if kingside else 3, rank)
+            self.animations.append(MoveTween(self.board.piece_at(rook_from).symbol(), rook_to,
+                                             self.to_screen(rook_from), self.to_screen(rook_to),
+                                             self.animation_speed))
+
+    def finish_animations(self, now):
+        """Закончившиеся анимации убираются - фигуры встают на доску"""
+        self.animations = [t for t in self.animations if not t.done(now)]
 
     def undo_move(self):
-        if self.is_thinking or len(self.history) == 0: return
+        if len(self.history) == 0: return
         if self.is_lan_mode: return 
         
-        if len(self.board.move_stack) > 0:
-            self.board.pop(); self.history.pop()
-        if len(self.board.move_stack) > 0:
-            self.board.pop(); self.history.pop()
+        # Пока ИИ думает, отменяется только ход игрока, иначе - пара ходов
+        undo_count = 1 if self.is_thinking else 2
+        self.cancel_searches()
+        self.animations = []
+        for _ in range(undo_count):
+            if len(self.board.move_stack) > 0:
+                self.board.pop(); self.history.pop()
         
         self.selected_square = None
         self.game_over_flag = False
         self.game_status = "Ваш ход"
         self.show_hints = False
         self.hint_moves = []
+        
+        # Отменили единственный ход ИИ за белых - он ходит заново
+        if self.board.turn != self.player_side:
+            self.is_thinking = True
+            self.game_status = "ИИ думает..."
+            self.start_search("ai", self.run_ai)
 
-    def calculate_hints(self):
+    def calculate_hints(self, generation, stop):
+        """
+        Три лучших хода (MultiPV) на копии доски; таблица транспозиций общая с ИИ,
+        поэтому ветки, уже просчитанные им, не ищутся заново. Повторный запрос
+        в той же позиции берёт линии из кэша
+        """
         try:
-            moves = order_moves(self.board, list(self.board.legal_moves))
-            scored = []
-            for m in moves[:6]:
-                self.board.push(m)
-                s = minimax(self.board, self.ai_depth-1, -999999, 999999, not self.board.turn)
-                self.board.pop()
-                scored.append((m, s))
-            scored.sort(key=lambda x: x[1], reverse=(self.board.turn==chess.WHITE))
-            self.hint_queue.put([x[0] for x in scored[:3]])
+            board = self.board.copy()
+            key = zobrist_hash(board)
+            cached = self.hint_cache
+            if cached is not None and cached[0] == key and cached[1] >= self.ai_depth:
+                lines = cached[2]
+            else:
+                lines = multipv_search(board, self.ai_depth, 3, self.search_ctx.fork(stop))
+                self.hint_cache = (key, self.ai_depth, lines)
+            self.post(self.hint_queue, (generation, lines))
         except: pass
 
     def execute_move(self, move):
-        if self.is_lan_mode and self.board.turn == self.player_side:
+        # Соперник сыграл ожидаемый ход - результат обдумывания пригодится
+        ponder_hit = self.ponder_result if self.ponder_result and self.ponder_result[0] == move else None
+        self.cancel_searches()
+        own_lan_move = self.is_lan_mode and self.board.turn == self.player_side
+        if own_lan_move:
             self.network.send_move(move.uci())
         
-        if self.timer_enabled: self.timer_running = False
+        if self.timer_enabled:
+            self.timer_running = False
+            if self.board.turn == chess.WHITE: self.time_white += self.time_increment
+            else: self.time_black += self.time_increment
+            # Соперник сверяет часы по нашим после каждого хода
+            if own_lan_move: self.network.send_clock(self.time_white, self.time_black)
             
         capture = self.board.is_capture(move)
         is_promotion = move.promotion is not None
         
-        self.animate_move(move)
+        self.start_animation(move)
         self.board.push(move)
         self.history.append(move.uci())
         self.selected_square = None
@@ -824,16 +1085,41 @@ class ChessGame:
         if not self.is_lan_mode and not self.game_over_flag and self.board.turn != self.player_side:
             self.is_thinking = True
             self.game_status = "ИИ думает..."
-            threading.Thread(target=self.run_ai, daemon=True).start()
+            if ponder_hit and not self.timer_enabled and ponder_hit[2] >= self.ai_depth:
+                # Ответ уже посчитан на нужную глубину - ходим сразу
+                self.post(self.ai_queue, (self.search_generation, ponder_hit[1]))
+            else:
+                # Иначе обычный поиск: таблица транспозиций уже прогрета обдумыванием
+                self.start_search("ai", self.run_ai)
+        elif not self.is_lan_mode and not self.game_over_flag:
+            self.start_pondering()
         elif self.is_lan_mode and not self.game_over_flag:
             if self.board.turn == self.player_side: self.game_status = "Ваш ход"
             else: self.game_status = "Ход противника"
 
-    def run_ai(self):
+    def run_ai(self, generation, stop):
         try:
-            op = get_opening_move(self.board.copy())
-            best = op if op else find_best_move(self.board.copy(), self.ai_depth)
-            if best: self.ai_queue.put(best)
+            board = self.board.copy()
+            # Своя копия контекста: прерванный поиск не мешает следующему, таблица общая
+            ctx = self.search_ctx.fork(stop)
+            self.search_ctx = ctx
+            op = get_opening_move(board)
+            if op: best = op
+            elif self.timer_enabled:
+                # С часами глубину ограничивает только бюджет времени
+                remaining = self.time_white if board.turn == chess.WHITE else self.time_black
+                budget = allocate_time(remaining, self.time_increment, board.fullmove_number - 1)
+                best = iterative_deepening(board, MAX_SEARCH_DEPTH, budget, ctx)
+            elif self.search_workers > 1:
+                # Настройки, с которыми ход совпадает с последовательным поиском на той же глубине
+                if self.parallel_search is None:
+                    self.parallel_search = ParallelSearch(self.search_workers, **PARALLEL_OPTIONS)
+                best = self.parallel_search.find_best_move(board, self.ai_depth, stop)
+                # Главная линия для обдумывания - из процесса, считавшего выбранный ход
+                ctx.pv = self.parallel_search.pv
+            else:
+                best = find_best_move(board, self.ai_depth, ctx)
+            if best: self.post(self.ai_queue, (generation, best))
         except: pass
 
     def handle_click(self, pos):
@@ -846,11 +1132,11 @@ class ChessGame:
             elif self.menu_btn_rapid.is_clicked(pos): self.timer_enabled = True; self.timer_mode = "rapid"
             
             elif self.menu_btn_host.is_clicked(pos):
-                self.network.host_game()
-                self.game_status = "Ожидание игрока..."
+                if self.network.host_game(): self.game_status = "Ожидание игрока..."
+                else: self.game_status = "Порт занят"
             elif self.menu_btn_connect.is_clicked(pos):
                 if self.network.connect_to_game(self.input_ip.text): pass
-            elif self.menu_btn_quit.is_clicked(pos): pygame.quit(); sys.exit()
+            elif self.menu_btn_quit.is_clicked(pos): self.quit()
             return
         
         # Обработка диалога превращения пешки
@@ -865,7 +1151,10 @@ class ChessGame:
                     return
         
         # Кнопки панели
-        if self.btn_new.is_clicked(pos): self.state = "MENU"; self.network.connected = False
+        if self.btn_new.is_clicked(pos):
+            self.cancel_searches(); self.state = "MENU"
+            if self.is_lan_mode and not self.game_over_flag: self.network.send_resign()
+            self.network.close()
         elif self.btn_theme.is_clicked(pos): self.current_theme_idx = (self.current_theme_idx+1)%len(THEMES)
         elif self.btn_sound.is_clicked(pos): self.sound_manager.toggle()
         elif self.btn_undo.is_clicked(pos): self.undo_move()
@@ -873,11 +1162,11 @@ class ChessGame:
             if self.show_hints: self.show_hints = False
             else:
                 self.is_calculating_hints = True
-                threading.Thread(target=self.calculate_hints, daemon=True).start()
+                self.start_search("hint", self.calculate_hints)
         elif self.btn_level_down.is_clicked(pos): self.ai_depth = max(1, self.ai_depth-1)
-        elif self.btn_level_up.is_clicked(pos): self.ai_depth = min(6, self.ai_depth+1)
+        elif self.btn_level_up.is_clicked(pos): self.ai_depth = min(8, self.ai_depth+1)
         elif self.game_over_flag and self.go_btn_menu.is_clicked(pos): self.state = "MENU"
-        elif self.btn_quit.is_clicked(pos): pygame.quit(); sys.exit()
+        elif self.btn_quit.is_clicked(pos): self.quit()
         
         if self.is_thinking or self.game_over_flag: return
         if self.is_lan_mode and self.board.turn != self.player_side: return
@@ -912,9 +1201,79 @@ class ChessGame:
                 if p and p.color == self.board.turn: self.selected_square = sq
                 else: self.selected_square = None
 
+    def is_idle(self):
+        """Ничего не идёт и давно не было ввода - можно просыпаться с IDLE_FPS"""
+        if self.timer_running or self.is_thinking or self.is_calculating_hints or self.animations: return False
+        return time.time() - self.last_activity > IDLE_DELAY
+
+    def post(self, q, message):
+        """Кладёт сообщение в очередь главного цикла (из любого потока) и будит цикл"""
+        q.put((time.perf_counter(), message))
+        try: pygame.event.post(pygame.event.Event(self.wake_event))
+        except pygame.error: pass  # очередь событий SDL полна - сообщение заберёт следующий кадр
+
+    def dispatch_queues(self):
+        """Обрабатывает все накопившиеся сообщения всех очередей, а не по одному за кадр"""
+        for q, handler, name in self.queue_handlers:
+            meter = self.queue_latency[name]
+            while True:
+                try: stamp, message = q.get_nowait()
+                except queue.Empty: break
+                meter.add(time.perf_counter() - stamp)
+                handler(message)
+
+    # Результаты поисков из прошлых поколений (до отмены хода, новой партии) отбрасываются
+    def on_ai_move(self, message):
+        generation, m = message
+        if generation == self.search_generation:
+            self.execute_move(m)
+            self.is_thinking = False
+
+    def on_hint_lines(self, message):
+        generation, hint_lines = message
+        if generation == self.search_generation:
+            self.hint_lines = hint_lines
+            self.hint_moves = [move for move, _, _ in hint_lines]
+            self.show_hints = True
+            self.is_calculating_hints = False
+
+    def on_network_message(self, message):
+        kind, data = message
+        if kind == "HOST_READY": self.start_game(chess.WHITE, "LAN")
+        elif kind == "CLIENT_READY": self.start_game(chess.BLACK, "LAN")
+        elif kind == "DISCONNECT": self.game_status = "Связь разорвана"
+        elif kind == "CLOCK": self.time_white, self.time_black = data
+        elif kind == "RESIGN" and self.is_lan_mode and not self.game_over_flag:
+            self.game_over_flag = True
+            self.timer_running = False
+            self.game_status = "Соперник сдался"
+            self.sound_manager.play('checkmate')
+        elif kind == "MOVE":
+            try:
+                m = chess.Move.from_uci(data)
+                if m in self.board.legal_moves:
+                    self.cancel_searches()
+                    self.start_animation(m)
+                    self.board.push(m)
+                    self.history.append(m.uci())
+                    self.sound_manager.play('move')
+                    self.game_status = "Ваш ход"
+            except ValueError: pass
+
+    def quit(self):
+        if self.show_stats:
+            for name, meter in self.queue_latency.items(): print(f"Очередь {name}: {meter}")
+        pygame.quit()
+        sys.exit()
+
     def run(self):
         while True:
-            self.clock.tick(FPS)
+            if self.is_idle():
+                # В простое спим до события: ввод или post() из рабочего потока будят сразу
+                events = [pygame.event.wait(1000 // IDLE_FPS)] + pygame.event.get()
+            else:
+                self.clock.tick(FPS)
+                events = pygame.event.get()
             
             # Таймер
             if self.timer_enabled and self.timer_running and not self.game_over_flag:
@@ -928,61 +1287,36 @@ class ChessGame:
                     self.game_status = "Время вышло!"
                     self.sound_manager.play('checkmate')
 
-            # События из очередей
-            if not self.ai_queue.empty():
-                m = self.ai_queue.get()
-                pygame.event.pump(); time.sleep(0.1)
-                self.execute_move(m)
-                self.is_thinking = False
+            self.dispatch_queues()
+
+            # Ввод
+            for e in events:
+                if e.type == pygame.NOEVENT: continue
+                if e.type == pygame.QUIT: self.quit()
+                if e.type in self.redraw_events: self.frame_keys = {}
+                if self.state == "MENU": self.input_ip.handle_event(e)
+                if e.type == pygame.MOUSEBUTTONDOWN: self.handle_click(e.pos)
+                self.last_activity = time.time()
             
-            if not self.hint_queue.empty():
-                self.hint_moves = self.hint_queue.get()
-                self.show_hints = True
-                self.is_calculating_hints = False
-
-            if not self.network_queue.empty():
-                msg = self.network_queue.get()
-                if msg == "HOST_READY": self.start_game(chess.WHITE, "LAN")
-                elif msg == "CLIENT_READY": self.start_game(chess.BLACK, "LAN")
-                elif msg == "DISCONNECT": self.game_status = "Связь разорвана"
-                else:
-                    try:
-                        m = chess.Move.from_uci(msg)
-                        if m in self.board.legal_moves:
-                            self.animate_move(m)
-                            self.board.push(m)
-                            self.history.append(m.uci())
-                            self.sound_manager.play('move')
-                            self.game_status = "Ваш ход"
-                    except: pass
-
-            if self.state == "MENU":
-                self.draw_menu()
-                for e in pygame.event.get():
-                    if e.type == pygame.QUIT: pygame.quit(); sys.exit()
-                    self.input_ip.handle_event(e)
-                    if e.type == pygame.MOUSEBUTTONDOWN: self.handle_click(e.pos)
-            else:
-                self.screen.fill(BG_COLOR)
-                self.draw_board()
-                self.draw_pieces()
-                self.draw_panel()
-                
-                # Диалог превращения пешки
-                if self.promotion_dialog:
-                    self.draw_promotion_dialog()
-                
-                if self.game_over_flag:
-                    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); overlay.fill((0,0,0,180))
-                    self.screen.blit(overlay, (0,0))
-                    txt = self.font_title.render(self.game_status, True, (255,200,100))
-                    self.screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT//2-50)))
-                    self.go_btn_menu.draw(self.screen, self.font_ui)
-                for e in pygame.event.get():
-                    if e.type == pygame.QUIT: pygame.quit(); sys.exit()
-                    if e.type == pygame.MOUSEBUTTONDOWN: self.handle_click(e.pos)
-            pygame.display.flip()
+            if self.animations: self.finish_animations(time.time())
+            
+            dirty = self.render()
+            if dirty:
+                pygame.display.update(dirty)
+                self.last_activity = time.time()
 
 if __name__ == "__main__":
-    game = ChessGame()
+    # python chess_game.py --uci - движок по протоколу UCI без окна (см. uci.py)
+    if "--uci" in sys.argv:
+        import uci
+        sys.exit(uci.main())
+    # python chess_game.py --workers 8 - параллельный поиск ИИ на 8 процессах
+    # python chess_game.py --book openings.bin - дебютная книга в формате Polyglot
+    workers = 1
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+    if "--book" in sys.argv:
+        DEFAULT_BOOK.path = sys.argv[sys.argv.index("--book") + 1]
+    # python chess_game.py --stats - при выходе печатает задержки очередей ИИ/подсказок/сети
+    game = ChessGame(search_workers=workers, show_stats="--stats" in sys.argv)
     game.run()
\ No newline at end of file
@@ -6,24 +6,71 @@ Unit тесты для шахматного движка
 
 import unittest
 import chess
+import chess.polyglot
+import io
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import subprocess
+import threading
+import time
+import random
+import socket
 import sys
 
 # Импортируем функции из основного файла
-# Предполагается что основной файл называется chess_game.py
+# Движок вынесен в chess_engine.py (без pygame), chess_game.py его реэкспортирует
 try:
-    from chess_game import (
+    from chess_engine import (
         evaluate_board, 
         order_moves, 
         minimax, 
         find_best_move,
         get_opening_move,
-        PIECE_VALUES
+        PIECE_VALUES,
+        zobrist_hash,
+        zobrist_after,
+        TranspositionTable,
+        SearchContext,
+        TT_EXACT,
+        TT_LOWER,
+        iterative_deepening,
+        allocate_time,
+        evaluate_material,
+        evaluate_material_bitboard,
+        IncrementalEvaluator,
+        benchmark,
+        staged_moves,
+        ParallelSearch,
+        PARALLEL_OPTIONS,
+        BENCHMARK_FENS,
+        SearchCancelled,
+        MATE_SCORE,
+        MATE_BOUND,
+        _null_move_search,
+        see,
+        is_losing_capture,
+        multipv_search,
+        OpeningBook,
+        OPENING_BOOK,
+        BUILTIN_BOOK,
+        Bitbases,
+        KNOWN_WIN,
+        mop_up,
     )
 except ImportError:
-    print("⚠️  Не удалось импортировать функции из chess_game.py")
-    print("Убедитесь что файл chess_game.py находится в той же папке")
+    print("⚠️  Не удалось импортировать функции из chess_engine.py")
+    print("Убедитесь что файл chess_engine.py находится в той же папке")
     sys.exit(1)
 
+import book_builder
+import bitbase_builder
+import uci
+# Сетевой протокол живёт в интерфейсе; pygame при этом не загружается (ленивый импорт)
+import chess_game
+
 
 class TestPieceValues(unittest.TestCase):
     """Тесты базовых значений фигур"""
@@ -95,6 +142,88 @@ class TestBoardEvaluation(unittest.TestCase):
             self.assertEqual(eval_score, 0)
 
 
+class TestIncrementalEvaluator(unittest.TestCase):
+    """Тесты инкрементальной оценки материала и позиционных таблиц"""
+    
+    def test_matches_full_scan_over_random_games(self):
+        """Дельта совпадает с полным пересчётом (взятия, рокировки, превращения, на проходе)"""
+        rng = random.Random(11)
+        fens = [chess.STARTING_FEN,
+                "r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"]
+        for fen in fens:
+            board = chess.Board(fen)
+            evaluator = IncrementalEvaluator()
+            evaluator.reset(board)
+            for _ in range(150):
+                moves = list(board.legal_moves)
+                if not moves: break
+                move = rng.choice(moves)
+                evaluator.push(board, move)
+                board.push(move)
+                self.assertEqual(evaluator.evaluate(board), evaluate_material(board), board.fen())
+            while board.move_stack and evaluator.stack:
+                board.pop()
+                evaluator.pop()
+            self.assertEqual(evaluator.score, evaluate_material(board))
+    
+    def test_evaluate_board_uses_evaluator(self):
+        """evaluate_board с оценщиком даёт тот же результат"""
+        board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        evaluator = IncrementalEvaluator()
+        evaluator.reset(board)
+        self.assertEqual(evaluate_board(board, evaluator), evaluate_board(board))
+    
+    def test_debug_mode_cross_checks_search(self):
+        """Поиск в режиме отладки сверяет каждую оценку листа"""
+        board = chess.Board("r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        move = find_best_move(board, 2, SearchContext(debug_eval=True))
+        self.assertIn(move, board.legal_moves)
+    
+    def test_debug_mode_detects_drift(self):
+        """Расхождение с полным пересчётом обнаруживается"""
+        board = chess.Board()
+        evaluator = IncrementalEvaluator(debug=True)
+        evaluator.reset(board)
+        evaluator.score += 1
+        with self.assertRaises(AssertionError):
+            evaluator.evaluate(board)
+
+
+class TestBitboardEvaluation(unittest.TestCase):
+    """Тесты оценки по битбордам"""
+    
+    BENCH_FENS = [
+        chess.STARTING_FEN,
+        "r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8",
+    ]
+    
+    def test_identical_to_full_scan(self):
+        """Результат побитно совпадает с проходом по 64 полям"""
+        rng = random.Random(3)
+        for fen in self.BENCH_FENS:
+            board = chess.Board(fen)
+            for _ in range(100):
+                self.assertEqual(evaluate_material_bitboard(board), evaluate_material(board), board.fen())
+                moves = list(board.legal_moves)
+                if not moves: break
+                board.push(rng.choice(moves))
+    
+    def test_benchmark_evaluations_per_second(self):
+        """Микробенчмарк: оценок в секунду на фиксированном наборе позиций"""
+        boards = [chess.Board(fen) for fen in self.BENCH_FENS]
+        rates = {}
+        for func in (evaluate_material, evaluate_material_bitboard):
+            start = time.perf_counter()
+            for _ in range(500):
+                for board in boards:
+                    func(board)
+            rates[func.__name__] = 500 * len(boards) / (time.perf_counter() - start)
+        self.assertGreater(rates['evaluate_material_bitboard'], rates['evaluate_material'])
+
+
 class TestMoveOrdering(unittest.TestCase):
     """Тесты упорядочивания ходов"""
     
@@ -138,6 +267,131 @@ class TestMoveOrdering(unittest.TestCase):
             self.assertTrue(top_5_has_promotion, "Promotion not in top 5 moves")
 
 
+class TestOrderingHeuristics(unittest.TestCase):
+    """Тесты killer-ходов, истории и ответных ходов"""
+    
+    def test_record_cutoff_updates_tables(self):
+        """Отсечение тихим ходом попадает в killer-слоты, историю и таблицу ответов"""
+        board = chess.Board()
+        board.push_uci("e2e4")
+        ctx = SearchContext()
+        first, second = chess.Move.from_uci("g8f6"), chess.Move.from_uci("b8c6")
+        ctx.record_cutoff(board, first, 3, 1)
+        ctx.record_cutoff(board, second, 3, 1)
+        self.assertEqual(ctx.killers[1], [second, first])
+        self.assertEqual(ctx.history[first.from_square * 64 + first.to_square], 9)
+        self.assertEqual(ctx.counter_moves[chess.E2 * 64 + chess.E4], second)
+    
+    def test_killers_ordered_before_quiet_moves(self):
+        """Killer-ход идёт сразу после взятий и шахов"""
+        board = chess.Board()
+        ctx = SearchContext()
+        killer = chess.Move.from_uci("a2a3")
+        ctx.killers[0][0] = killer
+        ordered = order_moves(board, list(board.legal_moves), None, ctx, 0)
+        self.assertEqual(ordered[0], killer)
+    
+    def test_history_ages_between_searches(self):
+        """История делится пополам перед каждым новым поиском"""
+        ctx = SearchContext()
+        ctx.history[100] = 64
+        ctx.killers[2][0] = chess.Move.from_uci("e2e4")
+        ctx.new_search(chess.Board())
+        self.assertEqual(ctx.history[100], 32)
+        self.assertIsNone(ctx.killers[2][0])
+    
+    def test_fewer_nodes_on_benchmark(self):
+        """На наборе позиций эвристики уменьшают дерево и не меняют ходы"""
+        plain_nodes, _, plain_moves = benchmark(3, use_heuristics=False)
+        nodes, _, moves = benchmark(3)
+        self.assertLess(nodes, plain_nodes)
+        self.assertEqual(moves, plain_moves)
+
+
+class TestStagedMoves(unittest.TestCase):
+    """Тесты ленивой генерации ходов по стадиям"""
+    
+    def test_yields_every_legal_move_once(self):
+        """Все легальные ходы ровно по одному разу, при любом ходе из таблицы"""
+        rng = random.Random(5)
+        board = chess.Board("r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        ctx = SearchContext()
+        for _ in range(40):
+            legal = list(board.legal_moves)
+            if not legal: break
+            ctx.killers[0] = [rng.choice(legal), chess.Move.from_uci("a1a2")]
+            moves = list(staged_moves(board, rng.choice(legal), ctx, 0))
+            self.assertEqual(len(moves), len(legal))
+            self.assertEqual(set(moves), set(legal))
+            board.push(rng.choice(legal))
+    
+    def test_stage_order(self):
+        """Ход из таблицы, затем взятия, затем killer, затем тихие ходы"""
+        board = chess.Board("rnbqkb1r/pppp1ppp/5n2/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3")
+        ctx = SearchContext()
+        hash_move, killer = chess.Move.from_uci("d2d4"), chess.Move.from_uci("b1c3")
+        ctx.killers[0][0] = killer
+        moves = list(staged_moves(board, hash_move, ctx, 0))
+        self.assertEqual(moves[0], hash_move)
+        self.assertTrue(board.is_capture(moves[1]))
+        self.assertEqual(moves[2], killer)
+        self.assertFalse(any(board.is_capture(m) for m in moves[3:]))
+    
+    def test_ignores_illegal_hash_move(self):
+        """Ход из таблицы от другой позиции (коллизия) отбрасывается"""
+        board = chess.Board()
+        moves = list(staged_moves(board, chess.Move.from_uci("e7e5"), SearchContext(), 0))
+        self.assertNotIn(chess.Move.from_uci("e7e5"), moves)
+        self.assertEqual(len(moves), 20)
+
+
+class TestNodePipeline(unittest.TestCase):
+    """Тесты распознавания конца игры и повторений внутри поиска"""
+    
+    def test_terminal_positions_from_move_loop(self):
+        """Мат и пат распознаются по отсутствию ходов во внутреннем узле"""
+        stalemate = chess.Board("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1")
+        self.assertTrue(stalemate.is_stalemate())
+        self.assertEqual(minimax(stalemate, 2, -999999, 999999, False, SearchContext()), 0)
+        mate = chess.Board("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3")
+        self.assertTrue(mate.is_checkmate())
+        self.assertLess(minimax(mate, 2, -999999, 999999, True, SearchContext()), -90000)
+    
+    def test_repetition_from_key_stack(self):
+        """Повтор позиции из истории партии обнаруживается по стеку ключей"""
+        board = chess.Board()
+        for move_uci in ['g1f3', 'g8f6', 'f3g1', 'f6g8', 'g1f3', 'g8f6']:
+            board.push_uci(move_uci)
+        ctx = SearchContext()
+        ctx.new_search(board)
+        key = zobrist_hash(board)
+        repeat = ctx.make(board, chess.Move.from_uci("f3g1"), key)
+        self.assertTrue(ctx.is_repetition(repeat, board.halfmove_clock))
+        ctx.unmake(board)
+        fresh = ctx.make(board, chess.Move.from_uci("e2e4"), key)
+        self.assertFalse(ctx.is_repetition(fresh, board.halfmove_clock))
+        ctx.unmake(board)
+    
+    def test_repetition_scores_as_draw(self):
+        """Отстающая сторона находит повторение позиции вместо проигрыша"""
+        # Чёрные без ферзя, но могут повторить позицию ходом конём
+        board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/3Q2KN b - - 0 1")
+        self.assertGreater(minimax(board, 1, -999999, 999999, False, SearchContext()), 500)
+        for move_uci in ['g8h8', 'h1g3', 'h8g8', 'g3h1', 'g8h8', 'h1g3', 'h8g8', 'g3h1']:
+            board.push_uci(move_uci)
+        self.assertEqual(minimax(board, 1, -999999, 999999, False, SearchContext()), 0)
+    
+    def test_reports_nodes_per_second(self):
+        """Скорость поиска (узлов в секунду) на наборе позиций"""
+        nodes, seconds, moves = benchmark(3)
+        self.assertTrue(all(moves))
+        self.assertGreater(nodes, len(BENCHMARK_FENS))
+        self.assertGreater(seconds, 0)
+        self.assertGreater(nodes / seconds, 0)
+        # Узлы не зависят от скорости машины: повторный прогон обходит то же дерево
+        self.assertEqual(benchmark(3)[0], nodes)
+
+
 class TestMinimax(unittest.TestCase):
     """Тесты алгоритма minimax"""
     
@@ -239,6 +493,837 @@ class TestFindBestMove(unittest.TestCase):
             self.assertIn(best_move, board.legal_moves)
 
 
+class TestTranspositionTable(unittest.TestCase):
+    """Тесты Zobrist-хэша и таблицы транспозиций"""
+    
+    def test_incremental_hash_matches_full(self):
+        """Инкрементальный ключ совпадает с полным пересчётом (взятия, рокировки, превращения)"""
+        rng = random.Random(7)
+        for fen in [chess.STARTING_FEN,
+                    "r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"]:
+            board = chess.Board(fen)
+            key = zobrist_hash(board)
+            for _ in range(120):
+                moves = list(board.legal_moves)
+                if not moves: break
+                move = rng.choice(moves)
+                key = zobrist_after(board, move, key)
+                board.push(move)
+                self.assertEqual(key, zobrist_hash(board), f"Mismatch after {move.uci()} in {board.fen()}")
+    
+    def test_transpositions_share_key(self):
+        """Одна позиция, полученная разным порядком ходов, имеет один ключ"""
+        a, b = chess.Board(), chess.Board()
+        for m in ['g1f3', 'g8f6', 'b1c3']: a.push_uci(m)
+        for m in ['b1c3', 'g8f6', 'g1f3']: b.push_uci(m)
+        self.assertEqual(zobrist_hash(a), zobrist_hash(b))
+        self.assertNotEqual(zobrist_hash(a), zobrist_hash(chess.Board()))
+    
+    def test_replacement_policy(self):
+        """Глубокая запись не вытесняется мелкой, мелкая уходит во второй слот"""
+        tt = TranspositionTable(size_mb=1)
+        key_a, key_b = 5, 5 + tt.size  # одна и та же корзина
+        tt.store(key_a, 6, 10, TT_EXACT, None)
+        tt.store(key_b, 2, 20, TT_LOWER, None)
+        self.assertEqual(tt.probe(key_a)[1], 6)
+        self.assertEqual(tt.probe(key_b)[2], 20)
+        tt.new_search()
+        tt.store(key_b, 1, 30, TT_EXACT, None)
+        self.assertEqual(tt.probe(key_b)[2], 30)
+    
+    def test_warm_table_searches_fewer_nodes(self):
+        """Повторный поиск с тем же контекстом использует сохранённые результаты"""
+        board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        ctx = SearchContext()
+        first = find_best_move(board, 3, ctx)
+        cold_nodes = ctx.nodes
+        second = find_best_move(board, 3, ctx)
+        self.assertEqual(first, second)
+        self.assertLess(ctx.nodes, cold_nodes)
+
+
+class TestIterativeDeepening(unittest.TestCase):
+    """Тесты итеративного углубления с бюджетом времени"""
+    
+    def test_allocate_time_within_clock(self):
+        """Бюджет положительный и не превышает половины остатка"""
+        for remaining in [0.5, 10, 180, 600]:
+            budget = allocate_time(remaining, 0, 10)
+            self.assertGreater(budget, 0)
+            self.assertLessEqual(budget, max(0.05, remaining / 2))
+        self.assertGreater(allocate_time(60, 5, 10), allocate_time(60, 0, 10))
+    
+    def test_allocate_time_counts_full_moves(self):
+        """Остаток делится на ходы до 40-го, но не меньше чем на 15"""
+        self.assertAlmostEqual(allocate_time(60, 0, 0), 60 / 40)
+        self.assertAlmostEqual(allocate_time(60, 0, 20), 60 / 20)
+        self.assertAlmostEqual(allocate_time(60, 0, 30), 60 / 15)
+    
+    def test_respects_time_limit(self):
+        """Поиск укладывается в бюджет и возвращает легальный ход"""
+        board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        fen = board.fen()
+        ctx = SearchContext()
+        start = time.time()
+        move = iterative_deepening(board, 30, 0.5, ctx)
+        elapsed = time.time() - start
+        self.assertIn(move, board.legal_moves)
+        self.assertLess(elapsed, 1.5)
+        self.assertGreaterEqual(ctx.completed_depth, 1)
+        self.assertEqual(board.fen(), fen, "Board must be restored after an aborted iteration")
+    
+    def test_reports_each_iteration(self):
+        """Колбэк получает каждую завершённую итерацию по порядку"""
+        board = chess.Board()
+        seen = []
+        iterative_deepening(board, 3, None, SearchContext(), lambda depth, move, score, ctx: seen.append(depth))
+        self.assertEqual(seen, [1, 2, 3])
+    
+    def test_matches_fixed_depth(self):
+        """
+        Без ограничения времени результат совпадает с поиском фиксированной глубины:
+        та же оценка, что у alpha-beta сразу на глубину depth, и выбранный ход её даёт
+        (настройки, при которых оценка не зависит от порядка обхода)
+        """
+        for fen in BENCHMARK_FENS[1:5] + ["k7/8/1K6/8/8/8/8/7Q w - - 0 1"]:
+            board = chess.Board(fen)
+            sign = 1 if board.turn == chess.WHITE else -1
+            for depth in (2, 3):
+                ctx = SearchContext(**PARALLEL_OPTIONS)
+                move = iterative_deepening(board, depth, None, ctx)
+                fixed = sign * minimax(board, depth, -999999, 999999, board.turn, SearchContext(**PARALLEL_OPTIONS))
+                self.assertEqual(ctx.best_score, fixed, (fen, depth))
+                board.push(move)
+                after = sign * minimax(board, depth - 1, -999999, 999999, board.turn, SearchContext(**PARALLEL_OPTIONS))
+                board.pop()
+                # Мат после хода считается от нового корня - на полуход ближе
+                if abs(after) > MATE_BOUND: after -= 1 if after > 0 else -1
+                self.assertEqual(after, fixed, (fen, depth, move))
+
+
+class TestCancellation(unittest.TestCase):
+    """Тесты отмены фонового поиска"""
+    
+    def test_stop_event_cancels_search(self):
+        """Установленный флаг прерывает поиск, доска восстанавливается"""
+        board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        fen = board.fen()
+        stop = threading.Event()
+        stop.set()
+        with self.assertRaises(SearchCancelled):
+            iterative_deepening(board, 10, None, SearchContext(stop=stop))
+        self.assertEqual(board.fen(), fen)
+    
+    def test_cancel_from_other_thread(self):
+        """Отмена из другого потока останавливает глубокий поиск почти сразу"""
+        board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        stop = threading.Event()
+        outcome = []
+        def worker():
+            try: outcome.append(find_best_move(board.copy(), 12, SearchContext(stop=stop)))
+            except SearchCancelled: outcome.append("cancelled")
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.2)
+        start = time.time()
+        stop.set()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(outcome, ["cancelled"])
+    
+    def test_fork_shares_table_not_heuristics(self):
+        """Контекст другого потока делит таблицу транспозиций, но не killer-ходы и историю"""
+        ctx = SearchContext()
+        ctx.history[7] = 100
+        other = ctx.fork()
+        self.assertIs(other.tt, ctx.tt)
+        self.assertEqual(other.history[7], 100)
+        other.history[7] = 0
+        self.assertEqual(ctx.history[7], 100)
+
+
+class TestQuiescence(unittest.TestCase):
+    """Тесты форсированного поиска взятий в листьях"""
+    
+    def test_sees_recapture_at_horizon(self):
+        """На глубине 1 не берёт пешку ферзём, если её защищает пешка"""
+        board = chess.Board("4k3/8/3p4/4p3/8/8/4Q3/4K3 w - - 0 1")
+        plain = find_best_move(board, 1, SearchContext(use_quiescence=False))
+        quiet = find_best_move(board, 1, SearchContext())
+        self.assertEqual(plain.uci(), "e2e5")
+        self.assertNotEqual(quiet.uci(), "e2e5")
+    
+    def test_stable_leaf_score(self):
+        """Оценка в середине размена не зависит от того, где оборвался поиск"""
+        board = chess.Board("4k3/8/3p4/4p3/8/8/4Q3/4K3 w - - 0 1")
+        board.push_uci("e2e5")
+        ctx = SearchContext()
+        score = minimax(board, 0, -999999, 999999, False, ctx)
+        self.assertLess(score, 0, "Queen is lost after dxe5")
+    
+    def test_reports_node_counts(self):
+        """Количество узлов с форсированным поиском и без него"""
+        board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        counts = {}
+        for label, use_q, depth in [("plain d3", False, 3), ("qsearch d3", True, 3), ("plain d4", False, 4)]:
+            ctx = SearchContext(use_quiescence=use_q)
+            find_best_move(board, depth, ctx)
+            counts[label] = (ctx.nodes, ctx.qnodes)
+        self.assertEqual(counts["plain d3"][1], 0)
+        self.assertGreater(counts["qsearch d3"][1], 0)
+        self.assertLess(counts["qsearch d3"][1], counts["qsearch d3"][0])
+        self.assertGreater(counts["plain d4"][0], counts["plain d3"][0])
+
+
+class TestPrincipalVariationSearch(unittest.TestCase):
+    """Тесты negamax с PVS и окнами аспирации"""
+    
+    def test_same_moves_fewer_nodes(self):
+        """PVS и аспирация не меняют выбор хода и не увеличивают число узлов"""
+        plain_nodes, _, plain_moves = benchmark(3, use_pvs=False, use_aspiration=False)
+        pvs_nodes, _, pvs_moves = benchmark(3)
+        self.assertEqual(pvs_moves, plain_moves)
+        self.assertLessEqual(pvs_nodes, plain_nodes)
+    
+    def test_score_matches_full_window(self):
+        """Оценка корня одинакова с окнами аспирации и без них"""
+        board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        scores = []
+        for use_aspiration in (False, True):
+            ctx = SearchContext(use_aspiration=use_aspiration)
+            iterative_deepening(board, 4, ctx=ctx)
+            scores.append(ctx.best_score)
+        self.assertEqual(scores[0], scores[1])
+    
+    def test_prefers_shorter_mate(self):
+        """Мат в 1 оценивается выше мата в 2"""
+        board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        ctx = SearchContext()
+        move = iterative_deepening(board, 4, ctx=ctx)
+        self.assertEqual(move.uci(), "a1a8")
+        self.assertEqual(ctx.best_score, MATE_SCORE - 1)
+    
+    def test_black_score_is_white_pov(self):
+        """minimax по-прежнему возвращает оценку с точки зрения белых"""
+        board = chess.Board("4k3/8/8/8/8/8/8/q3K3 b - - 0 1")
+        self.assertLess(minimax(board, 2, -999999, 999999, False, SearchContext()), -500)
+
+
+class TestSelectivePruning(unittest.TestCase):
+    """Тесты нулевого хода и сокращения поздних ходов (LMR)"""
+    
+    FULL_WIDTH = dict(use_null_move=False, use_lmr=False)
+    
+    def test_fewer_nodes_same_moves(self):
+        """Выборочный поиск быстрее и на наборе позиций выбирает те же ходы"""
+        full_nodes, _, full_moves = benchmark(4, **self.FULL_WIDTH)
+        nodes, _, moves = benchmark(4)
+        self.assertEqual(moves, full_moves)
+        self.assertLess(nodes, full_nodes)
+    
+    def test_tactics_unchanged(self):
+        """Мат и выигрыш фигуры находятся и с сокращениями"""
+        for fen, expected in [("k7/8/1K6/8/8/8/8/7Q w - - 0 1", "h1h8"),
+                              ("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1", "a1a8"),
+                              ("4k3/8/8/3q4/8/8/8/3RK3 w - - 0 1", "d1d5")]:
+            board = chess.Board(fen)
+            full = find_best_move(board, 5, SearchContext(**self.FULL_WIDTH))
+            pruned = find_best_move(board, 5, SearchContext())
+            self.assertEqual(full.uci(), expected, fen)
+            self.assertEqual(pruned.uci(), expected, fen)
+    
+    def test_no_null_move_in_pawn_endgame(self):
+        """В пешечном окончании нулевой ход не делается (цугцванг)"""
+        board = chess.Board("8/8/4k3/4p3/4P3/4K3/8/8 w - - 0 1")
+        ctx = SearchContext()
+        ctx.set_root(board)
+        self.assertIsNone(_null_move_search(board, 6, -999, ctx, zobrist_hash(board)))
+        self.assertEqual(board.fen(), "8/8/4k3/4p3/4P3/4K3/8/8 w - - 0 1")
+    
+    def test_null_move_cutoff(self):
+        """С лишним ферзём пропуск хода всё равно держит beta"""
+        board = chess.Board("4k3/8/8/8/8/8/PPP5/1K1Q4 w - - 0 1")
+        ctx = SearchContext()
+        ctx.set_root(board)
+        self.assertIsNotNone(_null_move_search(board, 4, 100, ctx, zobrist_hash(board)))
+
+
+class TestStaticExchange(unittest.TestCase):
+    """Тесты статической оценки размена (SEE)"""
+    
+    def see_uci(self, fen, uci):
+        board = chess.Board(fen)
+        return see(board, chess.Move.from_uci(uci))
+    
+    def test_undefended_capture(self):
+        self.assertEqual(self.see_uci("4k3/8/8/4p3/8/8/4Q3/4K3 w - - 0 1", "e2e5"), PIECE_VALUES[chess.PAWN])
+    
+    def test_defended_by_pawn(self):
+        """Ферзь берёт пешку, защищённую пешкой - теряет ферзя за пешку"""
+        score = self.see_uci("4k3/8/3p4/4p3/8/8/4Q3/4K3 w - - 0 1", "e2e5")
+        self.assertEqual(score, PIECE_VALUES[chess.PAWN] - PIECE_VALUES[chess.QUEEN])
+    
+    def test_xray_behind_attacker(self):
+        """Вторая ладья за первой вступает в размен после её ухода"""
+        score = self.see_uci("4r1k1/8/8/4p3/8/8/4R3/4R1K1 w - - 0 1", "e2e5")
+        self.assertEqual(score, PIECE_VALUES[chess.PAWN])
+    
+    def test_pinned_defender_ignored(self):
+        """Связанный с королём конь не может отыграть"""
+        score = self.see_uci("4k3/3n4/8/1B2p3/8/5N2/8/4K3 w - - 0 1", "f3e5")
+        self.assertEqual(score, PIECE_VALUES[chess.PAWN])
+    
+    def test_pinned_along_line_recaptures(self):
+        """Связанная фигура бьёт вдоль линии связки (здесь - саму связывающую фигуру)"""
+        # Ферзь d2 связан слоном b4, но может отыграть на b4 после cxb4
+        score = self.see_uci("4k3/8/8/2p5/1b6/P7/3Q4/4K3 w - - 0 1", "a3b4")
+        self.assertEqual(score, PIECE_VALUES[chess.BISHOP])
+    
+    def test_king_cannot_recapture_defended(self):
+        """Король не бьёт на поле, которое защищено сквозь фигуру"""
+        self.assertEqual(self.see_uci("4k3/4p3/8/8/8/8/4R3/4RK2 w - - 0 1", "e2e7"), PIECE_VALUES[chess.PAWN])
+        self.assertLess(self.see_uci("4k3/4p3/8/8/8/8/4R3/5K2 w - - 0 1", "e2e7"), 0)
+    
+    def test_losing_captures_last(self):
+        """Проигрывающее взятие идёт после тихих ходов"""
+        board = chess.Board("4k3/8/3p4/4p3/8/8/4Q3/4K3 w - - 0 1")
+        losing = chess.Move.from_uci("e2e5")
+        self.assertTrue(is_losing_capture(board, losing))
+        moves = list(staged_moves(board, None, SearchContext()))
+        self.assertEqual(moves[-1], losing)
+        self.assertEqual(set(moves), set(board.legal_moves))
+
+
+class TestMultiPV(unittest.TestCase):
+    """Тесты поиска нескольких линий для подсказок"""
+    
+    FEN = "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8"
+    
+    def test_lines_sorted_with_pv(self):
+        board = chess.Board(self.FEN)
+        lines = multipv_search(board, 3, 3, SearchContext())
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(len({move for move, _, _ in lines}), 3)
+        scores = [score for _, score, _ in lines]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        for move, _, pv in lines:
+            self.assertEqual(pv[0], move)
+            replay = board.copy()
+            for m in pv:
+                self.assertIn(m, replay.legal_moves)
+                replay.push(m)
+        self.assertEqual(board.fen(), self.FEN)
+    
+    def test_scores_match_single_search(self):
+        """Оценки линий совпадают с отдельным поиском каждого хода"""
+        board = chess.Board(self.FEN)
+        ctx = SearchContext(use_null_move=False, use_lmr=False)
+        for move, score, _ in multipv_search(board, 2, 3, ctx):
+            board.push(move)
+            single = minimax(board, 1, -999999, 999999, False, SearchContext(use_null_move=False, use_lmr=False))
+            board.pop()
+            self.assertEqual(score, single, move.uci())
+    
+    def test_first_line_is_mate(self):
+        board = chess.Board("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        lines = multipv_search(board, 3, 3, SearchContext())
+        self.assertEqual(lines[0][0].uci(), "a1a8")
+        self.assertGreater(lines[0][1], 90000)
+        self.assertLess(lines[1][1], 90000)
+    
+    def test_does_not_age_shared_table(self):
+        """Подсказка не делает записи идущего поиска ИИ устаревшими"""
+        ai = SearchContext()
+        board = chess.Board(BENCHMARK_FENS[1])
+        find_best_move(board, 2, ai)
+        age = ai.tt.age
+        key = zobrist_hash(board)
+        entry = ai.tt.probe(key)
+        multipv_search(board.copy(), 2, 3, ai.fork())
+        self.assertEqual(ai.tt.age, age)
+        self.assertEqual(ai.tt.probe(key)[5], entry[5])
+    
+    def test_fewer_lines_than_requested(self):
+        board = chess.Board("k7/8/8/8/8/8/8/K7 w - - 0 1")
+        self.assertEqual(len(multipv_search(board, 2, 5, SearchContext())), 3)
+
+
+class TestBitbases(unittest.TestCase):
+    """Тесты битовых баз эндшпиля (строятся KRRK и нужная ему KRK - несколько секунд)"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        bitbase_builder.build(["KRRK"], cls.dir, log=lambda message: None)
+        cls.bitbases = Bitbases(cls.dir)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.bitbases.close()
+        shutil.rmtree(cls.dir)
+    
+    def wdl(self, board):
+        """Результат по правилам: мат, пат или проба базы"""
+        if board.is_checkmate(): return -1
+        if board.is_stalemate() or board.is_insufficient_material(): return 0
+        return self.bitbases.probe(board)
+    
+    def test_file_size(self):
+        self.assertEqual(os.path.getsize(os.path.join(self.dir, "KRK.bb")), 2 * 64 ** 3 // 8)
+        self.assertEqual(os.path.getsize(os.path.join(self.dir, "KRRK.bb")), 2 * 64 ** 4 // 8)
+    
+    def check_consistent(self, pieces, seed):
+        """Результат позиции - лучший из результатов после ходов (обе стороны, зеркальные позиции)"""
+        rng = random.Random(seed)
+        checked = 0
+        while checked < 300:
+            board = chess.Board(None)
+            wk, bk, *squares = rng.sample(range(64), 2 + len(pieces))
+            board.set_piece_at(wk, chess.Piece(chess.KING, chess.WHITE))
+            board.set_piece_at(bk, chess.Piece(chess.KING, chess.BLACK))
+            for piece_type, square in zip(pieces, squares):
+                board.set_piece_at(square, chess.Piece(piece_type, chess.WHITE))
+            board.turn = rng.choice(chess.COLORS)
+            if rng.random() < 0.5: board = board.mirror()
+            if not board.is_valid() or board.is_game_over(): continue
+            checked += 1
+            results = []
+            for move in board.legal_moves:
+                board.push(move)
+                results.append(-self.wdl(board))
+                board.pop()
+            self.assertEqual(self.bitbases.probe(board), max(results), board.fen())
+    
+    def test_consistent_with_moves(self):
+        self.check_consistent([chess.ROOK], 7)
+    
+    def test_four_pieces_consistent_with_moves(self):
+        """KRRK: взятия ладьи ведут в KRK"""
+        self.check_consistent([chess.ROOK, chess.ROOK], 11)
+    
+    def test_four_pieces_known_positions(self):
+        self.assertEqual(self.bitbases.probe(chess.Board("8/8/8/4k3/8/8/8/R3K2R w - - 0 1")), 1)
+        # Две ладьи на седьмой и восьмой горизонталях - мат
+        self.assertEqual(self.bitbases.probe(chess.Board("1R2k3/R7/8/8/8/8/8/4K3 b - - 0 1")), -1)
+        # Пат: ходить королём некуда, шаха нет
+        self.assertEqual(self.bitbases.probe(chess.Board("k7/7R/8/8/8/8/8/1R2K3 b - - 0 1")), 0)
+        self.assertEqual(self.bitbases.probe(chess.Board("k7/7R/8/8/8/8/8/1R2K3 w - - 0 1")), 1)
+        # Чёрные берут ладью, но KRK всё равно выигран
+        self.assertEqual(self.bitbases.probe(chess.Board("8/8/8/8/8/8/1kR5/4K2R b - - 0 1")), -1)
+    
+    def test_known_positions(self):
+        self.assertEqual(self.bitbases.probe(chess.Board("8/8/8/4k3/8/8/8/R3K3 w - - 0 1")), 1)
+        # Белые берут незащищённую ладью, а чёрные успевают её увести
+        self.assertEqual(self.bitbases.probe(chess.Board("8/8/8/8/8/8/1k5K/6r1 w - - 0 1")), 0)
+        self.assertEqual(self.bitbases.probe(chess.Board("8/8/8/8/8/8/1k5K/6r1 b - - 0 1")), 1)
+        self.assertEqual(self.bitbases.probe(chess.Board("8/8/8/8/8/2k5/8/r6K w - - 0 1")), -1)
+    
+    def test_not_in_bitbase(self):
+        self.assertIsNone(self.bitbases.probe(chess.Board()))
+        self.assertIsNone(self.bitbases.probe(chess.Board("8/8/8/4k3/8/8/8/Q3K3 w - - 0 1")))
+        self.assertIsNone(self.bitbases.probe(chess.Board("8/8/8/4k3/8/8/8/R3K3 w Q - 0 1")))
+        # Фигуры у обеих сторон - не в базах и не строятся
+        self.assertIsNone(self.bitbases.probe(chess.Board("8/8/3n4/4k3/8/8/8/R3K3 w - - 0 1")))
+        with self.assertRaises(ValueError):
+            bitbase_builder.parse_signature("KRKN")
+    
+    def test_search_mates_krk(self):
+        """С базой поиск на глубине 4 доводит KRK до мата в пределах правила 50 ходов"""
+        board = chess.Board("8/8/8/4k3/8/8/8/R3K3 w - - 0 1")
+        ctx = SearchContext(bitbases=self.bitbases)
+        while not board.is_game_over(claim_draw=True) and len(board.move_stack) < 100:
+            board.push(find_best_move(board, 4, ctx))
+        self.assertTrue(board.is_checkmate())
+    
+    def test_converts_into_bitbase(self):
+        """Размен в выигранное окончание оценивается как выигрыш сразу"""
+        board = chess.Board("8/8/8/4k3/8/3q4/8/3RK3 w - - 0 1")
+        score = minimax(board, 2, -999999, 999999, True, SearchContext(bitbases=self.bitbases))
+        self.assertGreater(score, KNOWN_WIN)
+    
+    def test_mop_up_prefers_edge(self):
+        center = chess.Board("8/8/8/4k3/8/8/8/R3K3 w - - 0 1")
+        edge = chess.Board("4k3/8/8/8/8/8/8/R3K3 w - - 0 1")
+        self.assertGreater(mop_up(edge, chess.WHITE), mop_up(center, chess.WHITE))
+
+
+class TestUCI(unittest.TestCase):
+    """Тесты режима UCI"""
+    
+    def setUp(self):
+        self.out = io.StringIO()
+        self.engine = uci.UCIEngine(self.out)
+    
+    def lines(self):
+        return self.out.getvalue().splitlines()
+    
+    def bestmove(self):
+        self.engine.wait()
+        last = self.lines()[-1].split()
+        self.assertEqual(last[0], "bestmove")
+        return chess.Move.from_uci(last[1])
+    
+    def test_handshake(self):
+        self.engine.handle("uci")
+        self.engine.handle("isready")
+        self.assertIn("uciok", self.lines())
+        self.assertEqual(self.lines()[-1], "readyok")
+    
+    def test_position_and_go_depth(self):
+        self.engine.handle("setoption name OwnBook value false")
+        self.engine.handle("position startpos moves e2e4 e7e5 g1f3")
+        self.engine.handle("go depth 3")
+        move = self.bestmove()
+        board = chess.Board()
+        for m in ["e2e4", "e7e5", "g1f3"]: board.push_uci(m)
+        self.assertIn(move, board.legal_moves)
+        infos = [line for line in self.lines() if line.startswith("info depth")]
+        self.assertEqual(len(infos), 3)
+        for key in ("score", "nodes", "nps", "time", "pv"):
+            self.assertIn(f" {key} ", infos[-1])
+    
+    def test_no_stale_ponder_move(self):
+        """Единственный ход ищется без поиска: главная линия прошлого поиска не выдаётся за ponder"""
+        board = chess.Board("k7/8/8/8/8/8/1q6/K7 w - - 0 1")
+        only = chess.Move.from_uci("a1b2")
+        self.engine.ctx.pv = [only, chess.Move.from_uci("a8b7")]
+        self.engine.handle("position fen " + board.fen())
+        self.engine.handle("go depth 3")
+        self.assertEqual(self.bestmove(), only)
+        self.assertEqual(self.lines()[-1], "bestmove a1b2")
+        self.assertEqual(self.engine.ctx.pv, [])
+    
+    def test_bad_arguments_keep_position(self):
+        """Ошибка в команде сообщается через info string, позиция остаётся прежней"""
+        self.engine.handle("position startpos moves e2e4")
+        fen = self.engine.board.fen()
+        for line in ["position startpos moves e2e4 e2e4", "position startpos moves zz",
+                     "position fen not/a/fen w - - 0 1", "go depth", "go movetime soon",
+                     "setoption name Hash value big"]:
+            self.assertTrue(self.engine.handle(line))
+            self.assertTrue(self.lines()[-1].startswith("info string "), line)
+            self.assertEqual(self.engine.board.fen(), fen)
+        self.engine.handle("isready")
+        self.assertEqual(self.lines()[-1], "readyok")
+    
+    def test_mate_score(self):
+        self.engine.handle("position fen 6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        self.engine.handle("go depth 3")
+        self.assertEqual(self.bestmove().uci(), "a1a8")
+        self.assertIn("score mate 1", self.out.getvalue())
+        self.assertEqual(uci.format_score(-(MATE_SCORE - 4)), "mate -2")
+        self.assertEqual(uci.format_score(35), "cp 35")
+    
+    def test_node_limit(self):
+        self.engine.handle("setoption name OwnBook value false")
+        self.engine.handle("position startpos")
+        self.engine.handle("go nodes 3000")
+        self.assertIn(self.bestmove(), chess.Board().legal_moves)
+        nodes = [int(line.split(" nodes ")[1].split()[0]) for line in self.lines() if line.startswith("info depth")]
+        self.assertLess(max(nodes), 3000)
+    
+    def test_stop_infinite(self):
+        """На go infinite bestmove приходит только после stop"""
+        self.engine.handle("position fen r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
+        self.engine.handle("go infinite")
+        time.sleep(0.3)
+        self.assertFalse(any(line.startswith("bestmove") for line in self.lines()))
+        self.engine.handle("stop")
+        self.assertTrue(self.lines()[-1].startswith("bestmove"))
+    
+    def test_quit(self):
+        self.assertFalse(self.engine.handle("quit"))
+        self.assertTrue(self.engine.handle("unknown command"))
+
+
+class TestHeadlessImport(unittest.TestCase):
+    """Движок и UCI импортируются без pygame, интерфейс загружает его лениво"""
+    
+    def run_python(self, code):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout.strip()
+    
+    def test_engine_without_pygame(self):
+        out = self.run_python("import sys, chess_engine, uci; print('pygame' in sys.modules)")
+        self.assertEqual(out, "False")
+    
+    def test_gui_reexports_engine(self):
+        out = self.run_python(
+            "import sys, chess_game, chess_engine\n"
+            "print(chess_game.find_best_move is chess_engine.find_best_move,"
+            " chess_game.DEFAULT_BOOK is chess_engine.DEFAULT_BOOK,"
+            " chess_game.evaluate_board is chess_engine.evaluate_board,"
+            " hasattr(chess_game, 'ProcessPoolExecutor') or hasattr(chess_game, 'mmap'),"
+            " hasattr(sys.modules['pygame'], 'mixer'))")
+        self.assertEqual(out, "True True True False True")
+
+
+class TestLanProtocol(unittest.TestCase):
+    """Тесты кадрового протокола игры по сети"""
+    
+    class Game:
+        """Вместо ChessGame: сообщения сети складываются в очередь"""
+        def __init__(self):
+            self.network_queue = queue.Queue()
+        
+        def post(self, q, message):
+            q.put(message)
+    
+    def test_frames_survive_coalescing_and_splitting(self):
+        stream = (chess_game.encode_frame(chess_game.MSG_MOVE, 1, b"e2e4") +
+                  chess_game.encode_frame(chess_game.MSG_RESIGN, 2) +
+                  chess_game.encode_frame(chess_game.MSG_MOVE, 3, b"e7e8q"))
+        expected = [(chess_game.MSG_MOVE, 1, b"e2e4"), (chess_game.MSG_RESIGN, 2, b""),
+                    (chess_game.MSG_MOVE, 3, b"e7e8q")]
+        # Все кадры одним куском
+        self.assertEqual(chess_game.FrameReader().feed(stream), expected)
+        # По байту: кадр отдаётся, только когда пришёл целиком
+        reader = chess_game.FrameReader()
+        frames = []
+        for i in range(len(stream)):
+            frames += reader.feed(stream[i:i + 1])
+        self.assertEqual(frames, expected)
+        self.assertEqual(reader.buffer, bytearray())
+    
+    def wait_message(self, game, timeout=5):
+        return game.network_queue.get(timeout=timeout)
+    
+    def test_loopback_move_latency(self):
+        """Два менеджера на 127.0.0.1: ход, часы, сдача, повтор номера и пинг"""
+        host_game, client_game = self.Game(), self.Game()
+        host = chess_game.NetworkManager(host_game)
+        client = chess_game.NetworkManager(client_game)
+        port = host.host_game(0)
+        self.assertIsNotNone(port)
+        try:
+            self.assertTrue(client.connect_to_game("127.0.0.1", port))
+            self.assertEqual(self.wait_message(client_game), ("CLIENT_READY", None))
+            self.assertEqual(self.wait_message(host_game), ("HOST_READY", None))
+            self.assertEqual(client.client_socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 1)
+            
+            latencies = []
+            for uci_move in ["e2e4", "g1f3", "f1c4", "e1g1"]:
+                start = time.perf_counter()
+                client.send_move(uci_move)
+                self.assertEqual(self.wait_message(host_game), ("MOVE", uci_move))
+                latencies.append(time.perf_counter() - start)
+            self.assertLess(max(latencies), 0.2)
+            
+            client.send_clock(175.5, 180)
+            self.assertEqual(self.wait_message(host_game), ("CLOCK", (175.5, 180.0)))
+            
+            # Кадр с уже полученным номером отбрасывается
+            client.client_socket.sendall(chess_game.encode_frame(chess_game.MSG_MOVE, client.send_seq, b"a2a3"))
+            client.send_resign()
+            self.assertEqual(self.wait_message(host_game), ("RESIGN", None))
+            
+            # Пинг уходит сразу после подключения; ответ приходит из потока приёма соперника
+            deadline = time.time() + 5
+            while client.rtt is None and time.time() < deadline: time.sleep(0.01)
+            self.assertIsNotNone(client.rtt)
+            self.assertLess(client.rtt, 0.2)
+        finally:
+            client.close()
+        self.assertEqual(self.wait_message(host_game), ("DISCONNECT", None))
+        host.close()
+
+    
+    def test_corrupt_frame_disconnects(self):
+        """Кадр с неверными данными не убивает поток приёма молча: игра получает DISCONNECT"""
+        for msg_type, payload in [(chess_game.MSG_PING, b"\x01"), (chess_game.MSG_CLOCK, b"\x00" * 3),
+                                  (chess_game.MSG_MOVE, b"\xff\xfe")]:
+            host_game, client_game = self.Game(), self.Game()
+            host = chess_game.NetworkManager(host_game)
+            client = chess_game.NetworkManager(client_game)
+            port = host.host_game(0)
+            try:
+                self.assertTrue(client.connect_to_game("127.0.0.1", port))
+                self.assertEqual(self.wait_message(host_game), ("HOST_READY", None))
+                self.assertEqual(self.wait_message(client_game), ("CLIENT_READY", None))
+                client.client_socket.sendall(chess_game.encode_frame(msg_type, 1000, payload))
+                self.assertEqual(self.wait_message(host_game), ("DISCONNECT", None))
+                self.assertFalse(host.connected)
+                # Соперник видит разрыв со своей стороны
+                self.assertEqual(self.wait_message(client_game), ("DISCONNECT", None))
+            finally:
+                client.close()
+                host.close()
+
+
+class TestGameHeadless(unittest.TestCase):
+    """Тесты окна игры без экрана и звука (драйверы SDL dummy)"""
+    
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    
+    def make_game(self, **options):
+        game = chess_game.ChessGame(**options)
+        self.addCleanup(game.cancel_searches)
+        return game
+    
+    def test_render_cache_reuses_surfaces(self):
+        """Спрайты фигур и слой доски рисуются один раз; слой пересобирается при смене темы"""
+        cache = self.make_game().render_cache
+        self.assertIs(cache.piece("Q"), cache.piece("Q"))
+        self.assertIsNot(cache.piece("Q"), cache.piece("q"))
+        layer = cache.board(0, chess.WHITE)
+        self.assertIs(cache.board(0, chess.WHITE), layer)
+        self.assertIsNot(cache.board(1, chess.WHITE), layer)
+        self.assertIs(cache.highlight((1, 2, 3)), cache.highlight((1, 2, 3)))
+    
+    def test_hover_redraws_only_panel(self):
+        """Курсор над кнопкой панели перерисовывает только панель; без изменений кадр пустой"""
+        from unittest import mock
+        game = self.make_game()
+        game.start_game(chess.WHITE, "AI")
+        mouse = chess_game.pygame.mouse
+        with mock.patch.object(mouse, "get_pos", return_value=(0, 0)):
+            self.assertEqual(game.render(), [chess_game.pygame.Rect(chess_game.BOARD_AREA),
+                                             chess_game.pygame.Rect(chess_game.PANEL_AREA)])
+            self.assertEqual(game.render(), [])
+        with mock.patch.object(mouse, "get_pos", return_value=game.btn_hint.rect.center):
+            self.assertEqual(game.render(), [chess_game.pygame.Rect(chess_game.PANEL_AREA)])
+            self.assertEqual(game.render(), [])
+    
+    def test_tween_finishes_after_animation_time(self):
+        """Анимация хода длится ANIMATION_TIME, затем фигура встаёт на клетку"""
+        game = self.make_game()
+        game.start_game(chess.WHITE, "AI")
+        move = chess.Move.from_uci("e1g1")
+        game.board = chess.Board("4k3/8/8/8/8/8/8/4K2R w K - 0 1")
+        game.start_animation(move)
+        game.board.push(move)
+        king, rook = game.animations
+        self.assertEqual(king.duration, chess_game.ANIMATION_TIME)
+        start = king.start
+        self.assertEqual(king.position(start), game.to_screen(chess.E1))
+        game.finish_animations(start + chess_game.ANIMATION_TIME / 2)
+        self.assertEqual(len(game.animations), 2)
+        self.assertNotIn(king.position(start + chess_game.ANIMATION_TIME / 2),
+                         (game.to_screen(chess.E1), game.to_screen(chess.G1)))
+        # Ладья стартует вместе с королём (в тот же вызов) и заканчивает в то же время
+        end = max(start, rook.start) + chess_game.ANIMATION_TIME
+        self.assertEqual(king.position(end), game.to_screen(chess.G1))
+        self.assertEqual(rook.position(end), game.to_screen(chess.F1))
+        game.finish_animations(end)
+        self.assertEqual(game.animations, [])
+    
+    def test_dispatch_drains_every_queue(self):
+        """Все накопившиеся сообщения обрабатываются за один вызов, а не по одному за кадр"""
+        game = self.make_game()
+        game.start_game(chess.BLACK, "LAN")
+        for i in range(50):
+            game.post(game.network_queue, ("CLOCK", (180 - i, 180)))
+        for uci_move in ["e2e4", "e7e5", "g1f3"]:
+            game.post(game.network_queue, ("MOVE", uci_move))
+        game.post(game.hint_queue, (game.search_generation - 1, []))
+        game.dispatch_queues()
+        for q, _, _ in game.queue_handlers:
+            self.assertTrue(q.empty())
+        self.assertEqual(game.queue_latency["network"].count, 53)
+        self.assertEqual(game.queue_latency["hint"].count, 1)
+        self.assertEqual((game.time_white, game.time_black), (131, 180))
+        self.assertEqual([m.uci() for m in game.board.move_stack], ["e2e4", "e7e5", "g1f3"])
+    
+    def test_ponders_after_parallel_search(self):
+        """Поиск на нескольких процессах оставляет главную линию, и обдумывание включается"""
+        game = self.make_game(search_workers=2)
+        game.board = chess.Board(BENCHMARK_FENS[1])
+        game.run_ai(game.search_generation, threading.Event())
+        self.addCleanup(game.parallel_search.shutdown)
+        _, (_, best) = game.ai_queue.get(timeout=30)
+        pv = game.search_ctx.pv
+        self.assertEqual(pv[0], best)
+        self.assertGreaterEqual(len(pv), 2)
+        game.board.push(best)
+        game.start_pondering()
+        self.assertEqual(game.ponder_move, pv[1])
+
+
+class TestParallelSearch(unittest.TestCase):
+    """Тесты параллельного поиска на пуле процессов"""
+    
+    @classmethod
+    def setUpClass(cls):
+        # Как в интерфейсе: с этими настройками ход совпадает с последовательным поиском
+        cls.search = ParallelSearch(2, **PARALLEL_OPTIONS)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.search.shutdown()
+    
+    def serial(self, board, depth):
+        return find_best_move(board, depth, SearchContext(**PARALLEL_OPTIONS))
+    
+    def test_same_move_as_serial(self):
+        """На равной глубине выбирается тот же ход, что и последовательным поиском"""
+        fens = BENCHMARK_FENS + [
+            # Позиции, где ходы расходились при отсечениях, зависящих от порядка обхода
+            "rn2kb1r/1b2ppp1/1p1q1n2/p1p4p/5P2/4P2P/PPPP2PR/1RBQKBN1 w kq - 1 9",
+            "r1b1k1nr/5pbp/nppp1qpB/p3p3/2P1P1PP/1P1PKN2/P4P2/RN2QB1R b kq - 0 12",
+        ]
+        for fen in fens:
+            board = chess.Board(fen)
+            self.assertEqual(self.search.find_best_move(board, 3), self.serial(board, 3), fen)
+    
+    def test_same_move_as_serial_on_random_positions(self):
+        """Случайные позиции из партий на глубинах 2 и 3"""
+        rng = random.Random(1)
+        for i in range(20):
+            board = chess.Board()
+            for _ in range(rng.randint(6, 60)):
+                moves = list(board.legal_moves)
+                if not moves: break
+                board.push(rng.choice(moves))
+            if board.legal_moves.count() < 2: continue
+            depth = 2 + i % 2
+            serial = self.serial(board, depth)
+            self.assertEqual(self.search.find_best_move(board, depth), serial, board.fen())
+            self.assertEqual(self.search.pv[0], serial)
+    
+    def test_finds_checkmate_in_one(self):
+        """Мат в 1 ход находится и параллельным поиском"""
+        board = chess.Board("k7/8/1K6/8/8/8/8/7Q w - - 0 1")
+        move = self.search.find_best_move(board, 3)
+        board.push(move)
+        self.assertTrue(board.is_checkmate())
+    
+    def test_cancel_stops_workers(self):
+        """Отмена прерывает поиск во всех процессах"""
+        stop = threading.Event()
+        stop.set()
+        with self.assertRaises(SearchCancelled):
+            self.search.find_best_move(chess.Board(BENCHMARK_FENS[1]), 8, stop)
+        self.assertEqual(self.search.find_best_move(chess.Board(BENCHMARK_FENS[0]), 2),
+                         self.serial(chess.Board(BENCHMARK_FENS[0]), 2))
+    
+    def test_overlapping_calls(self):
+        """Поиск, отменённый из другого потока, не портит результат следующего вызова"""
+        stop = threading.Event()
+        errors = []
+        def cancelled():
+            try: self.search.find_best_move(chess.Board(BENCHMARK_FENS[1]), 6, stop)
+            except SearchCancelled: errors.append("cancelled")
+        thread = threading.Thread(target=cancelled)
+        thread.start()
+        time.sleep(0.2)
+        stop.set()
+        board = chess.Board(BENCHMARK_FENS[2])
+        self.assertEqual(self.search.find_best_move(board, 2), self.serial(board, 2))
+        thread.join()
+        self.assertEqual(errors, ["cancelled"])
+    
+    def test_black_to_move(self):
+        """Оценки корня со стороны чёрных переворачиваются правильно"""
+        board = chess.Board("4k3/8/8/3q4/8/8/3R4/4K3 b - - 0 1")
+        self.assertEqual(self.search.find_best_move(board, 2), self.serial(board, 2))
+
+
 class TestOpeningBook(unittest.TestCase):
     """Тесты дебютной книги"""
     
@@ -269,6 +1354,183 @@ class TestOpeningBook(unittest.TestCase):
             self.assertIn(opening_move, board.legal_moves)
 
 
+class TestPolyglotBook(unittest.TestCase):
+    """Тесты двоичной книги в формате Polyglot"""
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "book.bin")
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def write_book(self, entries):
+        """entries: [(board, move_uci, weight)]; записи сортируются по ключу, как того требует формат"""
+        records = []
+        for board, move_uci, weight in entries:
+            move = chess.Move.from_uci(move_uci)
+            raw = move.to_square | (move.from_square << 6)
+            records.append(struct.pack(">QHHI", chess.polyglot.zobrist_hash(board), raw, weight, 0))
+        records.sort()
+        with open(self.path, "wb") as f:
+            f.write(b"".join(records))
+    
+    def test_builtin_keys_match_fen_book(self):
+        self.assertEqual(len(BUILTIN_BOOK), len(OPENING_BOOK))
+        for fen, moves in OPENING_BOOK.items():
+            self.assertEqual(BUILTIN_BOOK[chess.polyglot.zobrist_hash(chess.Board(fen))], moves)
+    
+    def test_weighted_choice(self):
+        """Ход с нулевым весом не выбирается"""
+        board = chess.Board()
+        self.write_book([(board, "b1c3", 0), (board, "g2g3", 10)])
+        book = OpeningBook(self.path)
+        rng = random.Random(1)
+        try:
+            for _ in range(20):
+                self.assertEqual(book.choose(board, rng).uci(), "g2g3")
+        finally:
+            book.close()
+    
+    def test_falls_back_to_builtin(self):
+        """Позиции нет в файле - ход из встроенной книги"""
+        self.write_book([(chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1"), "e1e2", 1)])
+        book = OpeningBook(self.path)
+        try:
+            self.assertIn(book.choose(chess.Board()).uci(), OPENING_BOOK[chess.STARTING_FEN])
+        finally:
+            book.close()
+    
+    def test_missing_file(self):
+        book = OpeningBook(os.path.join(self.dir, "missing.bin"))
+        self.assertIn(get_opening_move(chess.Board(), book).uci(), OPENING_BOOK[chess.STARTING_FEN])
+        self.assertIsNone(book.choose(chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1")))
+    
+    def test_open_error_goes_to_stderr(self):
+        """Ошибка открытия книги не попадает в stdout (там протокол UCI)"""
+        from contextlib import redirect_stderr, redirect_stdout
+        from unittest import mock
+        self.write_book([(chess.Board(), "e2e4", 1)])
+        book = OpeningBook(self.path)
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch("chess.polyglot.open_reader", side_effect=PermissionError("denied")), \
+                redirect_stdout(out), redirect_stderr(err):
+            self.assertIn(book.choose(chess.Board()).uci(), OPENING_BOOK[chess.STARTING_FEN])
+        self.assertEqual(out.getvalue(), "")
+        self.assertIn("denied", err.getvalue())
+    
+    def test_castling_move_converted(self):
+        """Рокировка из файла (король берёт ладью) возвращается обычным ходом короля"""
+        board = chess.Board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        self.write_book([(board, "e1h1", 1)])
+        book = OpeningBook(self.path)
+        try:
+            self.assertEqual(book.choose(board).uci(), "e1g1")
+        finally:
+            book.close()
+
+
+class TestBookBuilder(unittest.TestCase):
+    """Тесты построения книги из PGN"""
+    
+    GAMES = [
+        ("1-0", "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6"),
+        ("1-0", "1. e4 c5 2. Nf3 d6"),
+        ("0-1", "1. d4 d5 2. c4 e6"),
+        ("1/2-1/2", "1. e4 e5 2. Nf3 (2. Bc4 Nf6) 2... Nf6 3. Nxe5 d6"),
+        ("*", "1. c4 e5"),
+    ]
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.pgn = os.path.join(self.dir, "games.pgn")
+        with open(self.pgn, "w") as f:
+            for i, (result, moves) in enumerate(self.GAMES):
+                f.write(f'[Event "Test {i}"]\n[Result "{result}"]\n\n{moves} {result}\n\n')
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def read_entries(self, path):
+        with chess.polyglot.open_reader(path) as reader:
+            return {(e.move.uci(), e.weight) for e in reader.find_all(chess.Board())}
+    
+    def test_counts_and_weights(self):
+        out = os.path.join(self.dir, "book.bin")
+        games, entries, _ = book_builder.build_book([self.pgn], out, max_ply=4, workers=1)
+        self.assertEqual(games, 5)
+        # e4: две победы и ничья (2+2+1), d4 проиграл, c4 - без результата
+        self.assertEqual(self.read_entries(out), {("e2e4", 5)})
+        self.assertEqual(os.path.getsize(out) % 16, 0)
+    
+    def test_chunks_give_same_book(self):
+        """Деление файла на куски не теряет и не дублирует партии"""
+        single = os.path.join(self.dir, "single.bin")
+        chunked = os.path.join(self.dir, "chunked.bin")
+        book_builder.build_book([self.pgn], single, workers=1)
+        games = 0
+        stats = {}
+        for lo, hi in book_builder.chunk_ranges(self.pgn, 7):
+            part, n = book_builder.scan_chunk((self.pgn, lo, hi, 16))
+            book_builder.merge_stats(stats, part)
+            games += n
+        self.assertEqual(games, len(self.GAMES))
+        book_builder.write_book(stats, chunked)
+        with open(single, "rb") as a, open(chunked, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+    
+    def test_games_without_event_tag(self):
+        """Партия начинается с любого тега после ходов прошлой партии, не только с Event"""
+        path = os.path.join(self.dir, "tags.pgn")
+        with open(path, "w", encoding="utf-8-sig") as f:
+            for i, (result, moves) in enumerate(self.GAMES):
+                f.write(f'[Site "Board {i}"]\n[Event "Test {i}"]\n[Result "{result}"]\n{moves} {result}\n')
+        for chunks in (1, 3, 7, 40):
+            games = sum(book_builder.scan_chunk((path, lo, hi, 16))[1]
+                        for lo, hi in book_builder.chunk_ranges(path, chunks))
+            self.assertEqual(games, len(self.GAMES), chunks)
+    
+    def test_warns_when_no_games(self):
+        """Файл без партий не проходит молча"""
+        path = os.path.join(self.dir, "empty.pgn")
+        with open(path, "w") as f:
+            f.write("not a game\n")
+        with self.assertLogs("book_builder", "WARNING") as logs:
+            games, _, _ = book_builder.build_book([self.pgn, path], os.path.join(self.dir, "book.bin"), workers=1)
+        self.assertEqual(games, len(self.GAMES))
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("empty.pgn", logs.output[0])
+    
+    def test_ply_limit_and_variations(self):
+        """Ходы дальше лимита и из вариантов в книгу не попадают"""
+        out = os.path.join(self.dir, "book.bin")
+        book_builder.build_book([self.pgn], out, max_ply=2, workers=1)
+        board = chess.Board()
+        board.push_san("e4"); board.push_san("e5")
+        with chess.polyglot.open_reader(out) as reader:
+            self.assertEqual(list(reader.find_all(board)), [])
+        book_builder.build_book([self.pgn], out, max_ply=8, workers=1)
+        with chess.polyglot.open_reader(out) as reader:
+            self.assertNotIn("f1c4", {e.move.uci() for e in reader.find_all(board)})
+    
+    def test_book_used_by_engine(self):
+        out = os.path.join(self.dir, "book.bin")
+        book_builder.build_book([self.pgn], out, workers=1)
+        book = OpeningBook(out)
+        try:
+            self.assertEqual(get_opening_move(chess.Board(), book).uci(), "e2e4")
+        finally:
+            book.close()
+    
+    def test_castling_encoding(self):
+        board = chess.Board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        for move_uci, raw_uci in [("e1g1", "e1h1"), ("e1c1", "e1a1")]:
+            raw = book_builder.polyglot_move(board, chess.Move.from_uci(move_uci))
+            self.assertEqual(chess.Move(raw >> 6 & 63, raw & 63).uci(), raw_uci)
+        raw = book_builder.polyglot_move(chess.Board("8/P6k/8/8/8/8/8/K7 w - - 0 1"), chess.Move.from_uci("a7a8n"))
+        self.assertEqual(raw >> 12, 1)
+
+
 class TestEdgeCases(unittest.TestCase):
     """Тесты граничных случаев"""
     
@@ -310,7 +1572,6 @@ class TestPerformance(unittest.TestCase):
     
     def test_depth_3_completes_quickly(self):
         """Поиск глубиной 3 должен завершаться за разумное время"""
-        import time
         board = chess.Board()
         
         start = time.time()
@@ -322,7 +1583,6 @@ class TestPerformance(unittest.TestCase):
     
     def test_complex_position_works(self):
         """Сложная позиция не вызывает зависания"""
-        import time
         # Позиция из середины игры
         board = chess.Board("r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 8")
         
@@ -347,10 +1607,31 @@ def run_tests():
     # Добавляем все тесты
     suite.addTests(loader.loadTestsFromTestCase(TestPieceValues))
     suite.addTests(loader.loadTestsFromTestCase(TestBoardEvaluation))
+    suite.addTests(loader.loadTestsFromTestCase(TestIncrementalEvaluator))
+    suite.addTests(loader.loadTestsFromTestCase(TestBitboardEvaluation))
     suite.addTests(loader.loadTestsFromTestCase(TestMoveOrdering))
+    suite.addTests(loader.loadTestsFromTestCase(TestOrderingHeuristics))
+    suite.addTests(loader.loadTestsFromTestCase(TestStagedMoves))
+    suite.addTests(loader.loadTestsFromTestCase(TestNodePipeline))
     suite.addTests(loader.loadTestsFromTestCase(TestMinimax))
     suite.addTests(loader.loadTestsFromTestCase(TestFindBestMove))
+    suite.addTests(loader.loadTestsFromTestCase(TestTranspositionTable))
+    suite.addTests(loader.loadTestsFromTestCase(TestIterativeDeepening))
+    suite.addTests(loader.loadTestsFromTestCase(TestCancellation))
+    suite.addTests(loader.loadTestsFromTestCase(TestQuiescence))
+    suite.addTests(loader.loadTestsFromTestCase(TestPrincipalVariationSearch))
+    suite.addTests(loader.loadTestsFromTestCase(TestSelectivePruning))
+    suite.addTests(loader.loadTestsFromTestCase(TestStaticExchange))
+    suite.addTests(loader.loadTestsFromTestCase(TestMultiPV))
+    suite.addTests(loader.loadTestsFromTestCase(TestBitbases))
+    suite.addTests(loader.loadTestsFromTestCase(TestUCI))
+    suite.addTests(loader.loadTestsFromTestCase(TestHeadlessImport))
+    suite.addTests(loader.loadTestsFromTestCase(TestLanProtocol))
+    suite.addTests(loader.loadTestsFromTestCase(TestGameHeadless))
+    suite.addTests(loader.loadTestsFromTestCase(TestParallelSearch))
     suite.addTests(loader.loadTestsFromTestCase(TestOpeningBook))
+    suite.addTests(loader.loadTestsFromTestCase(TestPolyglotBook))
+    suite.addTests(loader.loadTestsFromTestCase(TestBookBuilder))
     suite.addTests(loader.loadTestsFromTestCase(TestEdgeCases))
     suite.addTests(loader.loadTestsFromTestCase(TestPerformance))
     
@@ -0,0 +1,221 @@
+"""
+Движок по протоколу UCI (stdin/stdout) - для турниров движков и тестовых стендов
+Запуск: python uci.py  или  python chess_game.py --uci
+
+Поддерживаются: uci, isready, ucinewgame, setoption (Hash, OwnBook),
+position [startpos | fen ...] [moves ...], go (depth, movetime, wtime, btime,
+winc, binc, nodes, infinite), stop, quit
+"""
+
+import sys
+import threading
+import time
+
+import chess
+
+from chess_engine import (
+    MATE_BOUND,
+    MATE_SCORE,
+    MAX_SEARCH_DEPTH,
+    SearchCancelled,
+    SearchContext,
+    TranspositionTable,
+    allocate_time,
+    get_opening_move,
+    iterative_deepening,
+)
+
+ENGINE_NAME = "Chess Game"
+ENGINE_AUTHOR = "Chess Game contributors"
+DEFAULT_HASH_MB = 32
+
+
+def format_score(score):
+    """Оценка со стороны ходящего в формате UCI: "cp 35" или "mate -3" (в ходах)"""
+    if score > MATE_BOUND:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score < -MATE_BOUND:
+        return f"mate -{(MATE_SCORE + score + 1) // 2}"
+    return f"cp {score}"
+
+
+class UCIEngine:
+    """
+    Обработчик команд UCI. Поиск идёт в отдельном потоке, поэтому stop и
+    isready обрабатываются во время поиска; bestmove печатает поток поиска
+    """
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.board = chess.Board()
+        self.ctx = SearchContext(TranspositionTable(DEFAULT_HASH_MB))
+        self.own_book = True
+        self.search_thread = None
+        self.stop = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, stream=None):
+        for line in stream or sys.stdin:
+            if not self.handle(line):
+                break
+        self.stop_search()
+
+    def handle(self, line):
+        """
+        Выполняет одну команду; False - команда quit
+        Ошибку в аргументах (неверный FEN или ход, нечисловое значение) движок
+        сообщает через info string и продолжает работу с прежней позицией
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        try:
+            return self.dispatch(tokens[0], tokens[1:])
+        except ValueError as error:
+            self.send(f"info string {tokens[0]}: {error}")
+            return True
+
+    def dispatch(self, command, args):
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 1024")
+            self.send("option name OwnBook type check default true")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop_search()
+            self.ctx = SearchContext(self.ctx.tt)
+            self.ctx.tt.clear()
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "position":
+            self.stop_search()
+            self.set_position(args)
+        elif command == "go":
+            self.stop_search()
+            self.go(args)
+        elif command == "stop":
+            self.stop_search()
+        elif command == "quit":
+            return False
+        return True
+
+    def set_option(self, args):
+        if "name" not in args:
+            return
+        value_at = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:value_at]).lower()
+        value = " ".join(args[value_at + 1:])
+        if name == "hash":
+            self.stop_search()
+            self.ctx = SearchContext(TranspositionTable(max(1, int(value))))
+        elif name == "ownbook":
+            self.own_book = value.lower() == "true"
+
+    def set_position(self, args):
+        moves_at = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            board = chess.Board(" ".join(args[1:moves_at]))
+        else:
+            board = chess.Board()
+        for uci in args[moves_at + 1:]:
+            board.push_uci(uci)
+        self.board = board
+
+    def go(self, args):
+        """Разбирает лимиты и запускает поиск в отдельном потоке"""
+        params = {}
+        for i, token in enumerate(args):
+            if token in ("depth", "movetime", "wtime", "btime", "winc", "binc", "nodes", "movestogo"):
+                if i + 1 == len(args):
+                    raise ValueError(f"no value after {token}")
+                params[token] = int(args[i + 1])
+        infinite = "infinite" in args
+
+        depth = min(params.get("depth", MAX_SEARCH_DEPTH), MAX_SEARCH_DEPTH)
+        time_limit = None
+        if "movetime" in params:
+            time_limit = params["movetime"] / 1000
+        elif not infinite:
+            ours, inc = ("wtime", "winc") if self.board.turn == chess.WHITE else ("btime", "binc")
+            if ours in params:
+                time_limit = allocate_time(params[ours] / 1000, params.get(inc, 0) / 1000,
+                                           self.board.fullmove_number - 1)
+
+        self.stop = threading.Event()
+        self.search_thread = threading.Thread(
+            target=self.search,
+            args=(self.board.copy(), depth, time_limit, params.get("nodes"), infinite, self.stop),
+            daemon=True)
+        self.search_thread.start()
+
+    def search(self, board, depth, time_limit, node_limit, infinite, stop):
+        start = time.time()
+        best = [None, []]
+
+        def on_iteration(depth, move, score, ctx):
+            elapsed = max(time.time() - start, 1e-6)
+            pv = ctx.tt.principal_variation(board) or [move]
+            if pv[0] != move:
+                pv = [move]
+            best[0], best[1] = move, pv
+            self.send(f"info depth {depth} score {format_score(score)} nodes {ctx.nodes} "
+                      f"nps {int(ctx.nodes / elapsed)} time {int(elapsed * 1000)} pv {' '.join(m.uci() for m in pv)}")
+
+        move = get_opening_move(board) if self.own_book else None
+        if move is not None:
+            self.send(f"info string book move {move.uci()}")
+            best[0] = move
+        elif not board.is_game_over():
+            ctx = self.ctx
+            ctx.stop = stop
+            ctx.node_limit = node_limit
+            try:
+                best[0] = iterative_deepening(board, depth, time_limit, ctx, on_iteration)
+                best[1] = ctx.pv if ctx.pv and ctx.pv[0] == best[0] else best[1]
+            except SearchCancelled:
+                pass
+            finally:
+                ctx.stop = None
+                ctx.node_limit = None
+
+        if infinite:
+            # В режиме infinite bestmove отправляется только после stop
+            stop.wait()
+        move = best[0]
+        if move is None:
+            # stop раньше первой итерации - любой легальный ход лучше, чем никакого
+            move = next(iter(board.legal_moves), None)
+        if move is None:
+            self.send("bestmove 0000")
+        elif len(best[1]) > 1 and best[1][0] == move:
+            self.send(f"bestmove {move.uci()} ponder {best[1][1].uci()}")
+        else:
+            self.send(f"bestmove {move.uci()}")
+
+    def stop_search(self):
+        if self.search_thread is not None:
+            self.stop.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def wait(self):
+        """Дождаться окончания текущего поиска (для тестов и скриптов)"""
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def main():
+    UCIEngine().run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())